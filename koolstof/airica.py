@@ -3,6 +3,7 @@
 import pandas as pd
 import numpy as np
 from matplotlib import dates as mdates
+from .misc import dbs_datetime
 from scipy import stats
 from calkulate.density import seawater_1atm_MP81
 import matplotlib.pyplot as plt
@@ -32,9 +33,16 @@ mapper_dbs = {
 }
 
 
-def read_dbs(filepath_or_buffer, encoding="unicode_escape", na_values="none", **kwargs):
+def read_dbs(
+    filepath_or_buffer,
+    encoding="unicode_escape",
+    na_values="none",
+    time_format="%H:%M",
+    **kwargs
+):
     """Import the dbs file generated by a Marianda AIRICA as a pandas DataFrame.
     All kwargs are passed to pandas.read_table.
+    Times are parsed with time_format (see koolstof.misc.dbs_datetime).
     """
     dbs = pd.read_table(
         filepath_or_buffer, encoding=encoding, na_values=na_values, **kwargs
@@ -42,9 +50,7 @@ def read_dbs(filepath_or_buffer, encoding="unicode_escape", na_values="none", **
     dbs.rename(mapper=mapper_dbs, axis=1, inplace=True)
     if "Unnamed: 32" in dbs:
         dbs.drop(columns="Unnamed: 32", inplace=True)
-    dbs["datetime"] = pd.to_datetime(
-        dbs.apply(lambda x: " ".join((x.date, x.time)), axis=1)
-    )
+    dbs["datetime"] = dbs_datetime(dbs.date, dbs.time, time_format)
     dbs["datenum"] = mdates.date2num(dbs.datetime)
     dbs["volume_sample"] = (dbs.mass_sample / dbs.density).round()  # microlitres
     return dbs
@@ -1,18 +1,272 @@
-import numpy as np
-from scipy import sparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np, pandas as pd
+from scipy import linalg, sparse
+from scipy.sparse import linalg as sparse_linalg
 
 
-def als(y, lam, p, niter=10):
-    """Baseline correction."""
+def _second_difference_bands(L):
+    """Upper bands of D.D^T for the second-difference matrix D, in the form used by
+    scipy.linalg.solveh_banded (second superdiagonal, first superdiagonal, main
+    diagonal).
+    """
+    stencil = np.array([1.0, -2.0, 1.0])
+    bands = np.zeros((3, L))
+    # Each column of D adds stencil[a] * stencil[b] to element (j + a, j + b)
+    for a in range(3):
+        for b in range(a, 3):
+            bands[2 - (b - a), b : b + L - 2] += stencil[a] * stencil[b]
+    return bands
+
+
+def als(y, lam, p, niter=10, solver="banded", tol=0.0, w=None, full_output=False):
+    """Baseline correction.
+
+    Parameters
+    ----------
+    y : array-like
+        The signal to find the baseline of.
+    lam : float
+        Smoothness penalty.
+    p : float
+        Asymmetry: weight given to points above the baseline.
+    niter : int, optional
+        Maximum number of iterations, by default 10.
+    solver : str, optional
+        How to solve the linear system in each iteration, by default "banded", which
+        uses a banded Cholesky decomposition (scipy.linalg.solveh_banded) of the
+        pentadiagonal matrix.  "sparse" uses scipy.sparse.linalg.spsolve instead.
+    tol : float, optional
+        Stop iterating once the fraction of points whose weights changed in an
+        iteration is no more than tol, by default 0.0, which stops only once the
+        weights do not change at all (after which further iterations would give the
+        same baseline).
+    w : array-like, optional
+        Weights to start from, e.g. the final weights of a previous run from
+        full_output, by default None (all ones).  If shorter than y, as when new data
+        have been added to the end of the signal, the extra points start at one.
+    full_output : bool, optional
+        Whether to also return a dict of diagnostics, by default False.
+
+    Returns
+    -------
+    np.ndarray
+        The baseline.
+    dict
+        Only if full_output: the number of iterations used ("niter"), the fraction of
+        weights that changed in the final iteration ("change") and the final weights
+        ("w").
+    """
     # https://stackoverflow.com/questions/29156532/python-baseline-correction-library
+    y = np.asarray(y, dtype=float)
+    L = len(y)
+    if w is None:
+        w = np.ones(L)
+    else:
+        w = np.append(np.asarray(w, dtype=float)[:L], np.ones(max(L - len(w), 0)))
+    if solver == "banded":
+        bands = lam * _second_difference_bands(L)
+
+        def solve(w):
+            Z = bands.copy()
+            Z[2] += w
+            return linalg.solveh_banded(Z, w * y, overwrite_ab=True, check_finite=False)
+
+    elif solver == "sparse":
+        D = sparse.diags([1, -2, 1], [0, -1, -2], shape=(L, L - 2))
+        D = lam * D.dot(D.transpose())
+        W = sparse.spdiags(w, 0, L, L)
+
+        def solve(w):
+            W.setdiag(w)
+            return sparse_linalg.spsolve(W + D, w * y)
+
+    else:
+        raise ValueError("solver must be 'banded' or 'sparse'.")
+    change = np.nan
+    for i in range(niter):
+        z = solve(w)
+        w_new = p * (y > z) + (1.0 - p) * (y < z)
+        change = np.mean(w_new != w)
+        w = w_new
+        if change <= tol:
+            break
+    if full_output:
+        return z, {"niter": i + 1, "change": change, "w": w}
+    else:
+        return z
+
+
+def _als_chunk(y, lam, p, kwargs):
+    """[process pool] Find the ALS baseline of one chunk."""
+    return als(y, lam, p, **kwargs)
+
+
+def als_windowed(
+    y, lam, p, window=20000, overlap=5000, processes=1, out=None, **kwargs
+):
+    """Baseline correction of a long signal in overlapping windows.
+
+    Each window is baseline-corrected separately with als and the results are blended
+    together with linear weights across each overlap, so the memory needed depends
+    on the window size rather than the length of the signal.  y is only read one
+    window at a time, so it can be e.g. a np.memmap or an array opened with
+    np.load(..., mmap_mode="r") to stream a long record from disk.
+
+    With lam=1e9 and p=1e-4, for 2 Hz LI-COR x_CO2 data, the default window and
+    overlap give baselines within 0.05 µmol/mol of running als on the whole record
+    at once.  Smaller overlaps are less accurate, especially for larger lam.
+
+    Parameters
+    ----------
+    y : array-like
+        The signal to find the baseline of.
+    lam : float
+        Smoothness penalty.
+    p : float
+        Asymmetry: weight given to points above the baseline.
+    window : int, optional
+        Number of points in each window, by default 20000.
+    overlap : int, optional
+        Number of points shared by consecutive windows, by default 5000.  The last
+        window is moved back to end at the end of y, so it may share more.
+    processes : int, optional
+        The maximum number of processes for the windows, by default 1, in which
+        case they are done one by one.  If None, it is the number of CPUs.
+    out : array-like, optional
+        Array (e.g. a np.memmap) to write the baseline into, by default None, in
+        which case a new array is created.
+    kwargs
+        Passed on to als().
+
+    Returns
+    -------
+    np.ndarray
+        The baseline (out, if provided).
+    """
+    assert 0 <= overlap < window, "overlap must be less than window."
+    if isinstance(y, pd.Series):
+        y = y.values
     L = len(y)
-    D = sparse.diags([1, -2, 1], [0, -1, -2], shape=(L, L - 2))
-    D = lam * D.dot(D.transpose())
-    w = np.ones(L)
-    W = sparse.spdiags(w, 0, L, L)
+    if out is None:
+        out = np.empty(L)
+    step = window - overlap
+    starts = list(range(0, L - overlap, step)) if L > window else [0]
+    # Move the last window back to full size, so it is never too short to solve
+    starts[-1] = min(starts[-1], max(L - window, 0))
+    ends = {s: e for s, e in zip(starts[1:], np.add(starts[:-1], window))}
+    chunks = (
+        (np.asarray(y[s : s + window], dtype=float), lam, p, kwargs) for s in starts
+    )
+
+    def blend(start, z):
+        """Write one window's baseline into out, blending into the previous one."""
+        end = start + len(z)
+        n_overlap = ends.get(start, start) - start
+        if n_overlap:
+            shared = slice(start, start + n_overlap)
+            t = np.arange(1, n_overlap + 1) / (n_overlap + 1)
+            out[shared] = (1 - t) * out[shared] + t * z[:n_overlap]
+        out[start + n_overlap : end] = z[n_overlap:]
+
+    if processes == 1:
+        for start, chunk in zip(starts, chunks):
+            blend(start, _als_chunk(*chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # Keep only a few windows in memory at once
+            max_pending = 2 * (processes or os.cpu_count())
+            pending = deque()
+            for start, chunk in zip(starts, chunks):
+                pending.append((start, executor.submit(_als_chunk, *chunk)))
+                if len(pending) >= max_pending:
+                    start_done, future = pending.popleft()
+                    blend(start_done, future.result())
+            while pending:
+                start_done, future = pending.popleft()
+                blend(start_done, future.result())
+    return out
+
+
+def als_batch(ys, lam, p, niter=10, tol=0.0, full_output=False):
+    """Baseline correction of many independent traces at once.
+
+    All the traces are solved together as one block-diagonal banded system in each
+    iteration, with the bands of D.D^T computed only once for each trace length.
+    Each trace gives the same baseline as als with solver="banded", and stops
+    iterating once its own weights have converged (see als).
+
+    Parameters
+    ----------
+    ys : 2-D array-like or list of 1-D array-likes
+        The traces to find the baselines of, either as rows of a 2-D array or as a
+        list of traces of different lengths.  A single 1-D trace is used for every
+        value of lam and p, e.g. for a parameter sweep.
+    lam : float or array-like
+        Smoothness penalty, either the same for all traces or one value per trace.
+    p : float or array-like
+        Asymmetry, either the same for all traces or one value per trace.
+    niter : int, optional
+        Maximum number of iterations, by default 10.
+    tol : float, optional
+        Convergence tolerance for the weights of each trace, by default 0.0.
+    full_output : bool, optional
+        Whether to also return a dict of diagnostics, by default False.
+
+    Returns
+    -------
+    np.ndarray or list
+        The baselines, as a 2-D array if ys is a 2-D array (or a single trace), or
+        otherwise as a list.
+    dict
+        Only if full_output: the number of iterations used ("niter") and the final
+        fraction of weights changed ("change") for each trace, as arrays.
+    """
+    if isinstance(ys, pd.DataFrame):
+        ys = ys.values
+    if isinstance(ys, np.ndarray) and ys.ndim == 1:
+        ys = ys[np.newaxis, :]
+    as_array = isinstance(ys, np.ndarray)
+    ys = [np.asarray(y, dtype=float) for y in ys]
+    n_traces = max(len(ys), np.size(lam), np.size(p))
+    if len(ys) == 1:
+        ys = ys * n_traces
+    lam = np.broadcast_to(lam, (n_traces,)).astype(float)
+    p = np.broadcast_to(p, (n_traces,)).astype(float)
+    assert len(ys) == n_traces, "Need one lam and p value for each trace."
+    # Stack all traces and their difference-matrix bands end to end
+    lengths = np.array([len(y) for y in ys])
+    starts = np.cumsum(lengths) - lengths
+    y = np.concatenate(ys)
+    bands_by_length = {L: _second_difference_bands(L) for L in set(lengths)}
+    bands = np.concatenate(
+        [lam[i] * bands_by_length[L] for i, L in enumerate(lengths)], axis=1
+    )
+    p_points = np.repeat(p, lengths)
+    w = np.ones(len(y))
+    z = np.zeros(len(y))
+    active = np.ones(n_traces, dtype=bool)
+    niters = np.zeros(n_traces, dtype=int)
+    change = np.full(n_traces, np.nan)
     for _ in range(niter):
-        W.setdiag(w)
-        Z = W + D
-        z = sparse.linalg.spsolve(Z, w * y)
-        w = p * (y > z) + (1.0 - p) * (y < z)
-    return z
+        active_points = np.repeat(active, lengths)
+        Z = bands.copy()
+        Z[2] += w
+        z_new = linalg.solveh_banded(Z, w * y, overwrite_ab=True, check_finite=False)
+        z[active_points] = z_new[active_points]
+        w_new = p_points * (y > z) + (1.0 - p_points) * (y < z)
+        changed = np.add.reduceat((w_new != w).astype(float), starts) / lengths
+        change[active] = changed[active]
+        w[active_points] = w_new[active_points]
+        niters[active] += 1
+        active &= ~(change <= tol)
+        if not active.any():
+            break
+    baselines = np.split(z, starts[1:])
+    if as_array:
+        baselines = np.array(baselines)
+    if full_output:
+        return baselines, {"niter": niters, "change": change}
+    else:
+        return baselines
@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 from matplotlib import dates as mdates
+from ..misc import dbs_datetime
 
 
 mapper_dbs = {
@@ -26,18 +27,23 @@ mapper_dbs = {
 }
 
 
-def read_dbs(filepath_or_buffer, encoding="unicode_escape", na_values="none", **kwargs):
+def read_dbs(
+    filepath_or_buffer,
+    encoding="unicode_escape",
+    na_values="none",
+    time_format="%H:%M",
+    **kwargs
+):
     """Import the dbs file generated by a Marianda AIRICA as a pandas DataFrame.
     Any kwargs are passed to pandas.read_table.
+    Times are parsed with time_format (see koolstof.misc.dbs_datetime).
     """
     dbs = pd.read_table(
         filepath_or_buffer, encoding=encoding, na_values=na_values, **kwargs
     )
     dbs.rename(mapper=mapper_dbs, axis=1, inplace=True)
     dbs.drop(columns="Unnamed: 32", inplace=True)
-    dbs["datetime"] = pd.to_datetime(
-        dbs.apply(lambda x: " ".join((x.date, x.time)), axis=1)
-    )
+    dbs["datetime"] = dbs_datetime(dbs.date, dbs.time, time_format)
     dbs["datenum"] = mdates.date2num(dbs.datetime)
     return dbs
 
@@ -58,46 +64,104 @@ def get_licor_resolution(licor):
     has been converted into a pandas DataFrame, and correct the 'datenum' and
     'datetime' column values in the DataFrame with second fractions.
     Input licor is generated with read_LI7000().
+
+    The samples within each whole second are spread evenly across it, so the
+    rate may change or samples be dropped or duplicated.  The first and last
+    seconds of the file, which are usually incomplete, are assumed to be at the
+    most common rate, with the first one finishing at the end of its second.
     """
-    # Find resolution
-    ldu = licor.datenum.unique()[1:-1]
-    lda = licor[np.isin(licor.datenum, ldu)].datenum
-    resolution = int(len(lda) / len(ldu))  # in Hz
-    timestep = 1 / resolution
+    seconds = licor.datetime.dt.floor("s").values.astype("datetime64[ns]")
+    # Position of each sample within its second (cumcount) and number per second
+    new_second = np.ones(len(seconds), dtype=bool)
+    new_second[1:] = seconds[1:] != seconds[:-1]
+    starts = np.flatnonzero(new_second)
+    sizes = np.diff(np.append(starts, len(seconds)))
+    position = np.arange(len(seconds)) - np.repeat(starts, sizes)
+    # Find resolution (in Hz)
+    if len(sizes) > 2:
+        resolution = np.bincount(sizes[1:-1]).argmax()
+    else:
+        resolution = sizes.max()
+    per_second = sizes.astype(float)
+    per_second[[0, -1]] = np.maximum(sizes[[0, -1]], resolution)
+    position[: sizes[0]] += int(per_second[0] - sizes[0])
+    second_fractions = position / np.repeat(per_second, sizes)
     # Apply correction
-    start_iloc = np.where(licor.datenum == ldu[0])[0][0]
-    second_fractions = np.linspace(0, 1 - timestep, resolution)
-    second_fractions_start = second_fractions[-start_iloc:]
-    second_fractions_middle = np.tile(second_fractions, len(ldu))
-    tail_iloc = np.where(licor.datenum == ldu[-1])[0][-1] + 1
-    tail_length = len(licor) - tail_iloc
-    second_fractions_end = second_fractions[:tail_length]
-    second_fractions = np.concatenate(
-        (second_fractions_start, second_fractions_middle, second_fractions_end)
+    licor["datetime"] = seconds + np.round(second_fractions * 1e9).astype(
+        "timedelta64[ns]"
     )
-    licor["datenum"] = licor.datenum + second_fractions / (60 * 60 * 24)
-    licor["datetime"] = mdates.num2date(licor.datenum)
+    licor["datenum"] = mdates.date2num(licor.datetime)
     return licor
 
 
-def read_LI7000(filepath_or_buffer, skiprows=2, **kwargs):
+dtypes_LI7000 = {
+    "CO2B um/m": "float32",
+    "H2OB mm/m": "float32",
+    "T C": "float32",
+    "P kPa": "float32",
+    "RH %": "float32",
+    "Flow V": "float32",
+}
+
+
+def read_LI7000(
+    filepath_or_buffer,
+    skiprows=2,
+    fast=False,
+    time_format="%Y-%m-%d %H:%M:%S",
+    **kwargs
+):
     """Import the text files recorded by a LI-COR LI-7000 as a pandas DataFrame.
     Any kwargs are passed to pandas.read_table.
+
+    With fast=True, the column dtypes are declared up front (float32 for all the
+    measurements, from dtypes_LI7000) and the timestamps are parsed with the fixed
+    time_format, instead of both being inferred.  The pyarrow engine can also be
+    used by passing engine="pyarrow" as a kwarg.
     """
+    if fast:
+        kwargs.setdefault("dtype", dtypes_LI7000)
     licor = pd.read_table(filepath_or_buffer, skiprows=skiprows, **kwargs)
     licor.rename(mapper=mapper_LI7000, axis=1, inplace=True)
-    licor["datetime"] = pd.to_datetime(licor.datetime)
+    if fast:
+        licor["datetime"] = pd.to_datetime(licor.datetime, format=time_format)
+    else:
+        licor["datetime"] = pd.to_datetime(licor.datetime)
     licor["datenum"] = mdates.date2num(licor.datetime)
     return get_licor_resolution(licor)
 
 
-def get_licor_samples(licor, dbs):
+def get_licor_samples(licor, dbs, check_order=False, return_segments=False):
     """Identify different samples in a LI-COR dataset based on the dbs file,
     and remove data from before the first match.
     Assumes that both datasets are ordered with datetime ascending.
+
+    Each LI-COR row is assigned to the last dbs row that started before it, in
+    a single pass with np.searchsorted.  If check_order, an AssertionError is
+    raised if either dataset is not in ascending datenum order.
+
+    If return_segments, a DataFrame indexed by dbs_ix is also returned, with
+    the integer positions in the returned licor at which each sample "start"s
+    and "end"s (exclusive).
     """
-    licor["dbs_ix"] = np.nan
-    for dbs_ix in dbs.index:
-        licor.loc[licor.datenum >= dbs.loc[dbs_ix].datenum, "dbs_ix"] = dbs_ix
-    licor = licor[~np.isnan(licor.dbs_ix)]
-    return licor
+    licor_datenum = licor.datenum.values
+    dbs = dbs[~np.isnan(dbs.datenum.values)]
+    dbs_datenum = dbs.datenum.values
+    if check_order:
+        assert (np.diff(licor_datenum) >= 0).all(), "licor is not in datenum order."
+        assert (np.diff(dbs_datenum) >= 0).all(), "dbs is not in datenum order."
+    dbs_iloc = np.searchsorted(dbs_datenum, licor_datenum, side="right") - 1
+    licor["dbs_ix"] = np.where(
+        dbs_iloc >= 0, dbs.index.values[np.maximum(dbs_iloc, 0)], np.nan
+    )
+    first = np.searchsorted(dbs_iloc, 0)
+    licor = licor.iloc[first:]
+    if return_segments:
+        starts = np.searchsorted(licor_datenum, dbs_datenum, side="left") - first
+        segments = pd.DataFrame(
+            {"start": starts, "end": np.append(starts[1:], len(licor))},
+            index=pd.Index(dbs.index, name="dbs_ix"),
+        )
+        return licor, segments
+    else:
+        return licor
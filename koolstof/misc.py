@@ -1,5 +1,5 @@
 import string
-import numpy as np
+import numpy as np, pandas as pd
 
 lcletter = dict(zip(range(1, 27), string.ascii_lowercase))
 
@@ -8,3 +8,40 @@ def sigfig(x, sf):
     """Return `x` to `sf` significant figures."""
     factor = 10.0 ** np.ceil(np.log10(np.abs(x)))
     return factor * np.around(x / factor, decimals=sf)
+
+
+def dbs_datetime(date, time, time_format="%H:%M"):
+    """Convert the date (MM/DD/YY) and time columns of a VINDTA or AIRICA dbs file
+    into datetimes, with NaT wherever either is missing.
+
+    Parameters
+    ----------
+    date : array-like
+        Dates in MM/DD/YY format, where two-digit years are assumed to be in the 21st
+        century, or MM/DD/YYYY.
+    time : array-like
+        Times of day.
+    time_format : str, optional
+        Format of the times, by default "%H:%M".  If any times do not match it (e.g.
+        they include seconds), or any dates are not in MM/DD/YY(YY) format, each
+        value is instead parsed separately with its format inferred, which is
+        slower.
+
+    Returns
+    -------
+    pd.Series
+        The dates and times as datetime64.
+    """
+    date = pd.Series(date, dtype=object)
+    time = pd.Series(np.asarray(time, dtype=object), index=date.index)
+    mdy = date.str.extract(r"^(\d+)/(\d+)/(\d+)$")
+    year = mdy[2].where(mdy[2].str.len() != 2, "20" + mdy[2])
+    datetime = year + "-" + mdy[0] + "-" + mdy[1] + " " + time
+    if not (mdy[2].isnull() & date.notnull() & time.notnull()).any():
+        try:
+            return pd.to_datetime(datetime, format="%Y-%m-%d " + time_format)
+        except ValueError:
+            pass
+    # Fall back to parsing each value separately, passing on any dates that did not
+    # fit the pattern as they are
+    return pd.to_datetime(datetime.fillna(date + " " + time), format="mixed")
@@ -16,13 +16,21 @@ Import data
 -----------
     read_dbs
     read_logfile
+    read_batch
+    LogfileFollower
+    LogfileTables
+    ParseCache
 
 Process and calibrate
 ---------------------
     get_counts_at
+    get_counts_matrix
     blank_correction
+    sweep_blank_windows
     calibrate_dic
+    OnlineCalibrator
     poison_correction
+    DicPipeline
 
 Data visualisation
 ------------------
@@ -31,10 +39,25 @@ Data visualisation
     plot_session_blanks
     plot_dic_offset
     plot_k_dic
+    qc_report
 """
 
-from .read import read_dbs, read_logfile
-from .get import blank_correction, calibrate_dic, get_counts_at
+from .read import (
+    LogfileFollower,
+    LogfileTables,
+    ParseCache,
+    read_batch,
+    read_dbs,
+    read_logfile,
+)
+from .get import (
+    OnlineCalibrator,
+    blank_correction,
+    calibrate_dic,
+    get_counts_at,
+    get_counts_matrix,
+    sweep_blank_windows,
+)
 from .plot import (
     plot_blanks,
     plot_dic_offset,
@@ -43,4 +66,6 @@ from .plot import (
     plot_session_blanks,
 )
 from .process import poison_correction
+from .pipeline import DicPipeline
+from .report import qc_report
 from . import plot, process
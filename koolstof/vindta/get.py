@@ -1,77 +1,154 @@
+import itertools
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import numpy as np, pandas as pd
 from scipy.optimize import least_squares
 from calkulate.density import seawater_1atm_MP81
-from .read import read_dbs, read_logfile
-
-
-def _get_logfile_index(dbs_row, logfile):
-    """[row.apply] Get index in logfile corresponding to a given row of the dbs file."""
-    if dbs_row.bottle in logfile.bottle.values:
-        logfile_index = np.where(
-            (dbs_row.bottle == logfile.bottle)
-            & (dbs_row.datetime_analysis == logfile.datetime_analysis)
-        )[0]
-        if np.size(logfile_index) == 1:
-            logfile_index = logfile.index[logfile_index[0]]
-        else:
-            print(
-                (
-                    "{} name/date matches found between dbs and logfile @ dbs loc {}"
-                ).format(np.size(logfile_index), dbs_row.name)
-            )
-            logfile_index = np.nan
+from .read import LogfileTables, read_dbs, read_logfile
+
+
+def _as_tables(logfile):
+    """Convert a logfile DataFrame into a LogfileTables, if it isn't one already."""
+    if isinstance(logfile, LogfileTables):
+        return logfile
     else:
-        logfile_index = np.nan
-    return logfile_index
+        return LogfileTables.from_logfile(logfile)
 
 
 def get_logfile_index(dbs, logfile):
     """Find the index in the logfile corresponding to each row of the dbs file and add
     this in-place to the dbs as "logfile_index".
 
+    Rows are matched on both bottle name and analysis datetime.  Where there is not
+    exactly one match, the logfile_index is NaN.
+
     Parameters
     ----------
     dbs : pd.DataFrame
         The dbs file as a pandas DataFrame (imported with read_dbs).
-    logfile : pd.DataFrame
+    logfile : pd.DataFrame or LogfileTables
         The logfile as a pandas DataFrame (imported with read_logfile).
+
+    Returns
+    -------
+    pd.DataFrame
+        The bottle name, analysis datetime and number of matches for every row of
+        the dbs whose bottle name is in the logfile but which does not have exactly
+        one name/date match there.
     """
-    dbs["logfile_index"] = dbs.apply(_get_logfile_index, args=[logfile], axis=1)
-
-
-def _get_sample_blanks(dbs_row, logfile, use_from=6, use_to=100):
-    """[row.apply] Calculate each sample's DIC blank value."""
-    try:
-        lft = logfile.loc[dbs_row.logfile_index].table
-        use_minutes = (lft["minutes"] >= use_from) & (lft["minutes"] <= use_to)
-        blank_here = lft["increments"][use_minutes].mean()
-        blank_here_min = lft["increments"][use_minutes].min()
-        blank_here_max = lft["increments"][use_minutes].max()
-        blank_here_std = lft["increments"][use_minutes].std()
-        blank_here_count = use_minutes.sum()
-        run_time = lft["minutes"].max()
-        counts = lft["counts"].max()
-    except (ValueError, KeyError):
-        blank_here = np.nan
-        blank_here_min = np.nan
-        blank_here_max = np.nan
-        blank_here_std = np.nan
-        blank_here_count = 0
-        run_time = np.nan
-        counts = np.nan
-    return pd.Series(
+    if isinstance(logfile, LogfileTables):
+        logfile = logfile.frame
+    # Count the titrations in the logfile with each bottle name and analysis datetime
+    matches = (
+        pd.DataFrame(
+            {
+                "bottle": logfile.bottle.values,
+                "datetime_analysis": logfile.datetime_analysis.values.astype(
+                    "datetime64[ns]"
+                ),
+                "logfile_index": logfile.index,
+            }
+        )
+        .groupby(["bottle", "datetime_analysis"])
+        .logfile_index.agg(["first", "size"])
+    )
+    # Look up each row of the dbs in the table of matches
+    dbs_datetime = dbs.datetime_analysis.values.astype("datetime64[ns]")
+    ix = matches.index.get_indexer(
+        pd.MultiIndex.from_arrays([dbs.bottle.values, dbs_datetime])
+    )
+    # Index only the rows with matches, as the logfile may have no titrations
+    n_matches = np.zeros(len(ix), dtype=int)
+    n_matches[ix >= 0] = matches["size"].values[ix[ix >= 0]]
+    unique = n_matches == 1
+    logfile_index = np.full(len(ix), np.nan)
+    logfile_index[unique] = matches["first"].values[ix[unique]]
+    if ~np.isnan(logfile_index).any():
+        logfile_index = logfile_index.astype(logfile.index.dtype)
+    dbs["logfile_index"] = logfile_index
+    # Report rows whose bottle name is in the logfile, but not with a unique datetime
+    diagnostics = pd.DataFrame(
         {
-            "blank_here": blank_here,
-            "blank_here_min": blank_here_min,
-            "blank_here_max": blank_here_max,
-            "blank_here_std": blank_here_std,
-            "blank_here_count": blank_here_count,
+            "bottle": dbs.bottle.values,
+            "datetime_analysis": dbs_datetime,
+            "n_matches": n_matches,
+        },
+        index=dbs.index,
+    )[dbs.bottle.isin(logfile.bottle).values & (n_matches != 1)]
+    if len(diagnostics) > 0:
+        print(
+            (
+                "koolstof: {} dbs rows do not have exactly one name/date match in the "
+                + "logfile."
+            ).format(len(diagnostics))
+        )
+    return diagnostics
+
+
+def _get_titration_blanks(tables, use_from=6, use_to=100):
+    """Calculate the blank statistics for every titration at once, as segmented
+    reductions over the flat titration tables.
+    """
+    n = len(tables)
+    segments = tables.segment_ids
+    use_minutes = (tables.minutes >= use_from) & (tables.minutes <= use_to)
+    use_segments = segments[use_minutes]
+    use_increments = tables.increments[use_minutes]
+    count = np.bincount(use_segments, minlength=n)
+    has_blank = count > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.bincount(use_segments, weights=use_increments, minlength=n) / count
+        std = np.sqrt(
+            np.bincount(
+                use_segments,
+                weights=(use_increments - mean[use_segments]) ** 2,
+                minlength=n,
+            )
+            / count
+        )
+    blank_min = np.full(n, np.nan)
+    blank_max = np.full(n, np.nan)
+    if has_blank.any():
+        starts = (np.cumsum(count) - count)[has_blank]
+        blank_min[has_blank] = np.minimum.reduceat(use_increments, starts)
+        blank_max[has_blank] = np.maximum.reduceat(use_increments, starts)
+    run_time = np.full(n, np.nan)
+    counts = np.full(n, np.nan)
+    has_table = tables.lengths > 0
+    if has_table.any():
+        starts = tables.offsets[:-1][has_table]
+        run_time[has_table] = np.maximum.reduceat(tables.minutes, starts)
+        counts[has_table] = np.maximum.reduceat(tables.counts, starts)
+    return pd.DataFrame(
+        {
+            "blank_here": mean,
+            "blank_here_min": blank_min,
+            "blank_here_max": blank_max,
+            "blank_here_std": std,
+            "blank_here_count": count.astype(float),
             "run_time": run_time,
             "counts": counts,
         }
     )
 
 
+def _get_sample_blanks(ix, titration_blanks):
+    """Get the blank statistics for each sample from those for each titration, given
+    the integer position `ix` of each sample's titration (-1 if there is none), with
+    NaNs (and a zero count) where there is no matching titration or no increments in
+    the blank window.
+    """
+    found = ix >= 0
+    found[found] = titration_blanks.blank_here_count.values[ix[found]] > 0
+    sample_blanks = pd.DataFrame(
+        np.nan, index=np.arange(len(ix)), columns=titration_blanks.columns
+    )
+    sample_blanks["blank_here_count"] = 0.0
+    sample_blanks.loc[found] = titration_blanks.values[ix[found]]
+    return sample_blanks
+
+
 def get_sample_blanks(dbs, logfile, use_from=6, use_to=100):
     """Calculate each sample's DIC blank value and add this in-place to the dbs plus
     some relevant statistics.
@@ -83,7 +160,7 @@ def get_sample_blanks(dbs, logfile, use_from=6, use_to=100):
     ----------
     dbs : pd.DataFrame
         The dbs file as a pandas DataFrame (imported with read_dbs).
-    logfile : pd.DataFrame
+    logfile : pd.DataFrame or LogfileTables
         The logfile as a pandas DataFrame (imported with read_logfile).
     use_from : int, optional
         Which minute of the titration to begin counting as a blank measurement, by
@@ -92,13 +169,15 @@ def get_sample_blanks(dbs, logfile, use_from=6, use_to=100):
         Which minute of the titration to stop counting as a blank measurement, by
         default 100.
     """
+    tables = _as_tables(logfile)
     if "logfile_index" not in dbs:
-        get_logfile_index(dbs, logfile)
-    dbs_blanks = dbs.apply(
-        _get_sample_blanks, args=[logfile], axis=1, use_from=use_from, use_to=use_to
+        get_logfile_index(dbs, tables)
+    dbs_blanks = _get_sample_blanks(
+        tables.locate(dbs.logfile_index),
+        _get_titration_blanks(tables, use_from=use_from, use_to=use_to),
     )
     for blank in dbs_blanks.columns:
-        dbs[blank] = dbs_blanks[blank]
+        dbs[blank] = dbs_blanks[blank].values
 
 
 def _centre_and_scale(x, x_factor=None, x_offset=None):
@@ -129,13 +208,63 @@ def _lsqfun_blank_progression(x0, datenum_scaled, blank_here):
     return _blank_progression(x0, datenum_scaled) - blank_here
 
 
-def _get_session_blanks(dbs_group):
+def _jac_blank_progression(x0, datenum_scaled, blank_here):
+    """Jacobian of _lsqfun_blank_progression with respect to x0."""
+    datenum_scaled = np.asarray(datenum_scaled, dtype=float)
+    exp_term = np.exp(-(datenum_scaled - x0[3]) / x0[4])
+    jac = np.stack(
+        [
+            np.ones_like(datenum_scaled),
+            datenum_scaled,
+            exp_term,
+            x0[2] * exp_term / x0[4],
+            x0[2] * exp_term * (datenum_scaled - x0[3]) / x0[4] ** 2,
+        ],
+        axis=1,
+    )
+    # Where the blank is clipped at zero, it does not depend on x0
+    blank = x0[0] + x0[1] * datenum_scaled + x0[2] * exp_term
+    jac[blank < 0] = 0
+    return jac
+
+
+def _get_blank_start(datenum_scaled, blank_here, blank_start="default"):
+    """Get the starting point for fitting the blank progression in a session.
+
+    If blank_start is "linear", a straight line is fitted in closed form.  If it is
+    an array (e.g. the fit to the previous session), then whichever of it, the
+    straight-line fit and the default starting point has the lowest cost is used.
+    """
+    default_start = np.array([30, 1, 0, 1, 1], dtype=float)
+    if isinstance(blank_start, str):
+        assert blank_start in [
+            "default",
+            "linear",
+        ], "blank_start must be 'default', 'linear', 'previous' or an array."
+        if blank_start == "default":
+            return default_start
+    # Closed-form straight-line fit, with the exponential term switched off
+    slope, intercept = np.polyfit(datenum_scaled, blank_here, 1)
+    linear_start = np.array([intercept, slope, 0, 1, 1])
+    if isinstance(blank_start, str):
+        return linear_start
+    candidates = [np.asarray(blank_start, dtype=float), linear_start, default_start]
+    costs = [
+        np.sum(_lsqfun_blank_progression(c, datenum_scaled, blank_here) ** 2)
+        for c in candidates
+    ]
+    return candidates[np.nanargmin(costs)]
+
+
+def _get_session_blanks(dbs_group, session=None, blank_start="default"):
     """[group.apply] Calculate blanks per analysis session."""
     x = dbs_group
+    if session is None:
+        session = dbs_group.name
     if x.blank_here.isnull().all():
         print(
             "koolstof: No good blank_here values available for session '{}'.".format(
-                dbs_group.name
+                session
             )
         )
         blank_cols = pd.Series(
@@ -147,6 +276,7 @@ def _get_session_blanks(dbs_group):
                 "blank_progression": [np.nan] * 5,
                 "blank_fit_std": np.nan,
                 "blank_fit_rmse": np.nan,
+                "blank_fit_nfev": 0,
             }
         )
     else:
@@ -164,12 +294,16 @@ def _get_session_blanks(dbs_group):
             blank_prog = {
                 "x": [blank_here.values[0], 0, 0, 0, 1],
                 "fun": 0,
+                "nfev": 0,
             }
         else:
             blank_prog = least_squares(
                 _lsqfun_blank_progression,
-                [30, 1, 0, 1, 1],
-                args=[datenum_scaled, blank_here],
+                _get_blank_start(
+                    datenum_scaled.values, blank_here.values, blank_start=blank_start
+                ),
+                jac=_jac_blank_progression,
+                args=[datenum_scaled.values, blank_here.values],
             )
         blank_cols = pd.Series(
             data={
@@ -180,13 +314,40 @@ def _get_session_blanks(dbs_group):
                 "blank_progression": blank_prog["x"],
                 "blank_fit_std": np.std(blank_prog["fun"]),
                 "blank_fit_rmse": np.sqrt(np.mean(blank_prog["fun"] ** 2)),
+                "blank_fit_nfev": blank_prog["nfev"],
             }
         )
     return blank_cols
 
 
+def _executor_map(fn, *iterables, executor=None, max_workers=None, chunksize=1):
+    """Map fn over iterables either serially or with a pool of threads or processes,
+    returning a list of the results in the same order as the inputs.
+    """
+    if executor is None or executor == "serial":
+        return list(map(fn, *iterables))
+    elif isinstance(executor, Executor):
+        return list(executor.map(fn, *iterables, chunksize=chunksize))
+    else:
+        assert executor in [
+            "thread",
+            "process",
+        ], "executor must be 'serial', 'thread', 'process' or an Executor."
+        pool = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+        with pool(max_workers=max_workers) as ex:
+            return list(ex.map(fn, *iterables, chunksize=chunksize))
+
+
 def get_session_blanks(
-    dbs, logfile=None, session_col="dic_cell_id", use_from=6, use_to=100
+    dbs,
+    logfile=None,
+    session_col="dic_cell_id",
+    use_from=6,
+    use_to=100,
+    blank_start="default",
+    executor=None,
+    max_workers=None,
+    chunksize=1,
 ):
     """Calculate blanks per analysis session.
 
@@ -194,7 +355,7 @@ def get_session_blanks(
     ----------
     dbs : pd.DataFrame
         The dbs file as a pandas DataFrame (imported with read_dbs).
-    logfile : pd.DataFrame, optional
+    logfile : pd.DataFrame or LogfileTables, optional
         The logfile as a pandas DataFrame (imported with read_logfile), only necessary
         if you have not run get_sample_blanks on the dbs, by default None.
     session_col : str, optional
@@ -206,6 +367,24 @@ def get_session_blanks(
     use_to : int, optional
         Which minute of the titration to stop counting as a blank measurement, by
         default 100.
+    blank_start : str or array-like, optional
+        Where to start fitting the blank progression in each session, by default
+        "default", which uses [30, 1, 0, 1, 1].  If "linear", a straight line is
+        first fitted to each session's blanks in closed form.  If "previous", the
+        sessions are fitted in order of analysis time, each starting from the fit to
+        the previous session, unless the straight-line fit or the default is a better
+        starting point.  Alternatively, an array of five starting values, which is
+        used in the same way as the previous session's fit.
+    executor : str or concurrent.futures.Executor, optional
+        How to fit the sessions: one after another if None or "serial" (default),
+        or in parallel using a pool of threads ("thread") or processes ("process"),
+        or with an existing Executor.  Results are the same in every case.  Cannot be
+        used in parallel with blank_start="previous".
+    max_workers : int, optional
+        Maximum number of threads or processes, by default None, which uses the
+        concurrent.futures default.
+    chunksize : int, optional
+        Number of sessions to send to each process at a time, by default 1.
 
     Returns
     -------
@@ -219,11 +398,77 @@ def get_session_blanks(
         get_sample_blanks(dbs, logfile, use_from=use_from, use_to=use_to)
     if "blank_good" not in dbs:
         dbs["blank_good"] = ~dbs.blank_here.isnull()
-    sessions = dbs.groupby(by=session_col).apply(_get_session_blanks)
+    groups = dict(
+        list(
+            dbs[["blank_here", "blank_good", "datenum_analysis"]].groupby(
+                dbs[session_col]
+            )
+        )
+    )
+    if isinstance(blank_start, str) and blank_start == "previous":
+        assert executor in [
+            None,
+            "serial",
+        ], "Sessions can only be fitted serially with blank_start='previous'."
+        # Fit the sessions in time order, warm-starting each from the previous fit
+        session_order = sorted(
+            groups, key=lambda session: groups[session].datenum_analysis.mean()
+        )
+        session_start = "linear"
+        sessions = {}
+        for session in session_order:
+            sessions[session] = _get_session_blanks(
+                groups[session], session=session, blank_start=session_start
+            )
+            if ~np.isnan(sessions[session].blank_progression).any():
+                session_start = sessions[session].blank_progression
+        sessions = [sessions[session] for session in groups]
+    else:
+        sessions = _executor_map(
+            partial(_get_session_blanks, blank_start=blank_start),
+            groups.values(),
+            groups.keys(),
+            executor=executor,
+            max_workers=max_workers,
+            chunksize=chunksize,
+        )
+    sessions = pd.DataFrame(
+        sessions, index=pd.Index(list(groups), name=session_col)
+    ).infer_objects()
     sessions.sort_values("datenum_analysis_mean", inplace=True)
     return sessions
 
 
+def _get_counts_at(tables, ix, counts_loc=None, counts_iloc=None):
+    """Get the counts and minutes at one or more minutes (counts_loc) or index
+    locations (counts_iloc) of the titrations at integer positions `ix` in tables,
+    all at once.  Returns two arrays with one row per titration and one column per
+    minute or index location, with NaN where there is no titration or no such entry
+    in its table.
+    """
+    found = ix >= 0
+    starts = tables.offsets[:-1][ix[found]]
+    ends = tables.offsets[1:][ix[found]]
+    if counts_loc is not None:
+        minutes = np.atleast_1d(counts_loc).astype(float)
+        flat = np.full((len(tables), len(minutes)), -1)
+        for j, minute in enumerate(minutes):
+            # Where a minute appears more than once in a table, take the first
+            is_minute = np.flatnonzero(tables.minutes == minute)[::-1]
+            flat[tables.segment_ids[is_minute], j] = is_minute
+        flat = flat[ix[found]]
+    else:
+        ilocs = np.atleast_1d(counts_iloc)
+        flat = np.where(ilocs >= 0, starts[:, None], ends[:, None]) + ilocs
+        flat[(flat < starts[:, None]) | (flat >= ends[:, None])] = -1
+    counts = np.full((len(ix), flat.shape[1]), np.nan)
+    minutes = np.full((len(ix), flat.shape[1]), np.nan)
+    has_entry = flat >= 0
+    counts[found] = np.where(has_entry, tables.counts[flat], np.nan)
+    minutes[found] = np.where(has_entry, tables.minutes[flat], np.nan)
+    return counts, minutes
+
+
 def get_counts_at(
     dbs,
     logfile,
@@ -244,7 +489,7 @@ def get_counts_at(
     ----------
     dbs : pd.DataFrame
         The dbs file as a pandas DataFrame (imported with read_dbs).
-    logfile : pd.DataFrame
+    logfile : pd.DataFrame or LogfileTables
         The logfile as a pandas DataFrame (imported with read_logfile).
     col_name_counts : str, optional
         How to name the new column with counts, by default "counts_at".
@@ -262,18 +507,57 @@ def get_counts_at(
     ), "You cannot provide both `counts_loc` and `counts_iloc`!"
     if counts_loc is None and counts_iloc is None:
         counts_iloc = -1
+    tables = _as_tables(logfile)
     if "logfile_index" not in dbs:
-        get_logfile_index(dbs, logfile)
+        get_logfile_index(dbs, tables)
+    counts, minutes = _get_counts_at(
+        tables,
+        tables.locate(dbs.logfile_index),
+        counts_loc=counts_loc,
+        counts_iloc=counts_iloc,
+    )
     if counts_loc is not None:
-        for i, row in dbs[dbs.logfile_index.notnull()].iterrows():
-            lt = logfile.loc[row.logfile_index].table
-            dbs.loc[i, col_name_counts] = lt["counts"][lt["minutes"] == counts_loc]
-            dbs.loc[i, col_name_runtime] = counts_loc
-    elif counts_iloc is not None:
-        for i, row in dbs[dbs.logfile_index.notnull()].iterrows():
-            lt = logfile.loc[row.logfile_index].table
-            dbs.loc[i, col_name_counts] = lt["counts"][counts_iloc]
-            dbs.loc[i, col_name_runtime] = lt["minutes"][counts_iloc]
+        minutes[:] = counts_loc
+    matched = dbs.logfile_index.notnull().values
+    for col, values in zip([col_name_counts, col_name_runtime], [counts, minutes]):
+        if col not in dbs:
+            dbs[col] = np.nan
+        dbs.loc[matched, col] = values[matched, 0]
+
+
+def get_counts_matrix(dbs, logfile, minutes=None):
+    """Get the counts at several minutes of each titration, for example to look at
+    how the counts develop through time across many samples.
+
+    Parameters
+    ----------
+    dbs : pd.DataFrame
+        The dbs file as a pandas DataFrame (imported with read_dbs).
+    logfile : pd.DataFrame or LogfileTables
+        The logfile as a pandas DataFrame (imported with read_logfile).
+    minutes : array-like, optional
+        Which minutes of the titrations to take the counts from, by default None, in
+        which case every minute from 0 to the longest run time is used.
+
+    Returns
+    -------
+    pd.DataFrame
+        The counts, with the same index as the dbs and one column per minute, and
+        NaN where a sample has no matching titration or no entry at that minute.
+    """
+    tables = _as_tables(logfile)
+    if "logfile_index" not in dbs:
+        get_logfile_index(dbs, tables)
+    if minutes is None:
+        minutes = np.arange(np.max(tables.minutes, initial=0) + 1)
+    counts, _ = _get_counts_at(
+        tables, tables.locate(dbs.logfile_index), counts_loc=minutes
+    )
+    return pd.DataFrame(
+        counts,
+        index=dbs.index,
+        columns=pd.Index(np.atleast_1d(minutes), name="minutes"),
+    )
 
 
 def _get_counts_corrected(
@@ -304,7 +588,7 @@ def get_counts_corrected(
     ----------
     dbs : pd.DataFrame
         The dbs file as a pandas DataFrame (imported with read_dbs).
-    logfile : pd.DataFrame, optional
+    logfile : pd.DataFrame or LogfileTables, optional
         The logfile as a pandas DataFrame (imported with read_logfile), only necessary
         if you have not run get_sample_blanks on the dbs, by default None.
     sessions : pd.DataFrame, optional
@@ -338,19 +622,23 @@ def get_counts_corrected(
             use_from=use_from,
             use_to=use_to,
         )
-    dbs["datenum_analysis_scaled"] = np.nan
-    dbs["blank"] = np.nan
-    for session, s in sessions.iterrows():
-        l = dbs[sessions.index.name] == session
-        dbs.loc[l, "datenum_analysis_scaled"] = _centre_and_scale(
-            dbs.loc[l].datenum_analysis,
-            x_factor=s.datenum_analysis_std,
-            x_offset=s.datenum_analysis_mean,
-        )
-        dbs.loc[l, "blank"] = _blank_progression(
-            s.blank_progression,
-            dbs.loc[l].datenum_analysis_scaled,
+    # Look up the session blank fit for every sample at once
+    ix = sessions.index.get_indexer(dbs[sessions.index.name])
+    found = ix >= 0
+    s = sessions.iloc[ix[found]]
+    datenum_scaled = np.full(len(dbs), np.nan)
+    datenum_scaled[found] = _centre_and_scale(
+        dbs.datenum_analysis.values[found],
+        x_factor=s.datenum_analysis_std.values,
+        x_offset=s.datenum_analysis_mean.values,
+    )
+    blank = np.full(len(dbs), np.nan)
+    if found.any():
+        blank[found] = _blank_progression(
+            np.vstack(s.blank_progression.values).T, datenum_scaled[found]
         )
+    dbs["datenum_analysis_scaled"] = datenum_scaled
+    dbs["blank"] = blank
     dbs["counts_corrected"] = _get_counts_corrected(
         dbs, blank_col=blank_col, counts_col=counts_col, runtime_col=runtime_col
     )
@@ -365,6 +653,10 @@ def blank_correction(
     session_col="dic_cell_id",
     use_from=6,
     use_to=100,
+    blank_start="default",
+    executor=None,
+    max_workers=None,
+    chunksize=1,
 ):
     """Convenience wrapper for get_counts_corrected.  Returns the dbs with the blanks
     having been determined for each analysis session and counts thus corrected.
@@ -373,7 +665,7 @@ def blank_correction(
     ----------
     dbs : pd.DataFrame
         The dbs file as a pandas DataFrame (imported with read_dbs).
-    logfile : pd.DataFrame
+    logfile : pd.DataFrame or LogfileTables
         The logfile as a pandas DataFrame (imported with read_logfile).
     blank_col : str, optional
         The column name for blank values to use for corrections, by default 'blank'.
@@ -394,6 +686,16 @@ def blank_correction(
     use_to : int, optional
         Which minute of the titration to stop counting as a blank measurement, by
         default 100.
+    blank_start : str or array-like, optional
+        Where to start fitting the blank progression in each session, by default
+        "default"; see get_session_blanks for the options.
+    executor : str or concurrent.futures.Executor, optional
+        How to fit the sessions: "serial" (default), "thread", "process" or an
+        existing Executor; see get_session_blanks.
+    max_workers : int, optional
+        Maximum number of threads or processes, by default None.
+    chunksize : int, optional
+        Number of sessions to send to each process at a time, by default 1.
 
     Returns
     -------
@@ -401,7 +703,15 @@ def blank_correction(
         A table of analysis sessions including blank correction details.
     """
     sessions = get_session_blanks(
-        dbs, logfile=logfile, session_col=session_col, use_from=use_from, use_to=use_to
+        dbs,
+        logfile=logfile,
+        session_col=session_col,
+        use_from=use_from,
+        use_to=use_to,
+        blank_start=blank_start,
+        executor=executor,
+        max_workers=max_workers,
+        chunksize=chunksize,
     )
     get_counts_corrected(
         dbs,
@@ -416,6 +726,100 @@ def blank_correction(
     return sessions
 
 
+def sweep_blank_windows(
+    dbs,
+    logfile,
+    use_from=6,
+    use_to=100,
+    blank_col="blank",
+    counts_col="counts",
+    runtime_col="run_time",
+    session_col="dic_cell_id",
+):
+    """Run the blank correction for every combination of use_from and use_to values,
+    to help choose the blank window.
+
+    The dbs is matched to the logfile and the titration tables are indexed only once,
+    then the sample blanks, session blank fits and corrected counts are calculated
+    for each window.  The dbs itself is not modified.
+
+    Parameters
+    ----------
+    dbs : pd.DataFrame
+        The dbs file as a pandas DataFrame (imported with read_dbs).
+    logfile : pd.DataFrame or LogfileTables
+        The logfile as a pandas DataFrame (imported with read_logfile).
+    use_from : int or list, optional
+        Which minute(s) of the titration to begin counting as a blank measurement, by
+        default 6.
+    use_to : int or list, optional
+        Which minute(s) of the titration to stop counting as a blank measurement, by
+        default 100.
+    blank_col : str, optional
+        The column name for blank values to use for corrections, by default 'blank'.
+    counts_col : str, optional
+        The column name for uncorrected counts, by default 'counts'.
+    runtime_col : str, optional
+        The column name for run time, by default 'run_time'.
+    session_col : str, optional
+        The column name in the dbs that identifies analysis sessions, by default
+        'dic_cell_id'.
+
+    Returns
+    -------
+    sessions : pd.DataFrame
+        The blank fit data for each analysis session with each window, with one row
+        per session per window.
+    samples : pd.DataFrame
+        The blanks and corrected counts for each sample with each window, with one
+        row per sample per window and the dbs index in the column "dbs_index".
+    """
+    tables = _as_tables(logfile)
+    dbs = dbs.copy()
+    if "logfile_index" not in dbs:
+        get_logfile_index(dbs, tables)
+    ix = tables.locate(dbs.logfile_index)
+    sample_cols = [
+        session_col,
+        "blank_here",
+        "blank_here_std",
+        "blank_here_count",
+        blank_col,
+        "counts_corrected",
+    ]
+    sweep_sessions = []
+    sweep_samples = []
+    for window_from, window_to in itertools.product(
+        np.atleast_1d(use_from), np.atleast_1d(use_to)
+    ):
+        dbs_window = dbs.copy()
+        dbs_blanks = _get_sample_blanks(
+            ix, _get_titration_blanks(tables, use_from=window_from, use_to=window_to)
+        )
+        for blank in dbs_blanks.columns:
+            dbs_window[blank] = dbs_blanks[blank].values
+        sessions = get_session_blanks(dbs_window, session_col=session_col)
+        get_counts_corrected(
+            dbs_window,
+            sessions=sessions,
+            blank_col=blank_col,
+            counts_col=counts_col,
+            runtime_col=runtime_col,
+            session_col=session_col,
+        )
+        sessions = sessions.reset_index()
+        samples = dbs_window[sample_cols].rename_axis("dbs_index").reset_index()
+        for df in [sessions, samples]:
+            df.insert(0, "use_to", window_to)
+            df.insert(0, "use_from", window_from)
+        sweep_sessions.append(sessions)
+        sweep_samples.append(samples)
+    return (
+        pd.concat(sweep_sessions, ignore_index=True),
+        pd.concat(sweep_samples, ignore_index=True),
+    )
+
+
 def get_density(dbs, temperature_analysis_dic=25.0, salinity=35.0):
     """Calculate sample densities in kg/l.
 
@@ -506,3 +910,195 @@ def calibrate_dic(dbs, sessions):
     dbs["k_dic"] = sessions.loc[dbs[sessions.index.name]].k_dic_mean.values
     dbs["dic"] = dbs.counts_corrected * dbs.k_dic / dbs.density_analysis_dic
     dbs["dic_offset"] = dbs.dic - dbs.dic_certified
+
+
+class OnlineCalibrator:
+    """Session calibration factors that are updated as each CRM is measured.
+
+    Instead of waiting for a whole session to finish, as calibrate_dic does, each CRM
+    updates a running mean and variance of the calibration factor for its session
+    (with Welford's algorithm), so new samples can be calibrated straight away.  By
+    default every CRM in the session counts equally, which gives the same factors as
+    calibrate_dic once all the CRMs are in.  Alternatively, only the most recent CRMs
+    can be used (window), or older CRMs can be down-weighted exponentially with time
+    (halflife).
+
+    Parameters
+    ----------
+    session_col : str, optional
+        Name of the column in dbs that identifies analysis sessions, by default
+        "dic_cell_id".
+    window : int, optional
+        Use only the most recent `window` CRMs in each session, by default None (use
+        all of them).
+    halflife : float, optional
+        Time (in days) over which the weight of each CRM halves, by default None (all
+        CRMs weighted equally).  The dbs must then have a "datenum_analysis" column.
+    temperature_analysis_dic : float, optional
+        Temperature of DIC analysis in degC, used for rows of the dbs that do not
+        have their own, by default 25.0 (as in get_density).
+    salinity : float, optional
+        Practical salinity, used for rows of the dbs that do not have their own, by
+        default 35.0 (as in get_density).
+
+    Attributes
+    ----------
+    sessions : pd.DataFrame
+        The current k_dic_mean, k_dic_std and k_dic_count of each session.
+    """
+
+    def __init__(
+        self,
+        session_col="dic_cell_id",
+        window=None,
+        halflife=None,
+        temperature_analysis_dic=25.0,
+        salinity=35.0,
+    ):
+        assert window is None or halflife is None, "Use only one of window or halflife."
+        self.session_col = session_col
+        self.window = window
+        self.halflife = halflife
+        self.temperature_analysis_dic = temperature_analysis_dic
+        self.salinity = salinity
+        self._state = {}
+
+    def _density(self, dbs):
+        """Get the analysis densities of new rows of the dbs, without modifying it."""
+        if "density_analysis_dic" in dbs:
+            return dbs.density_analysis_dic
+        else:
+            return seawater_1atm_MP81(
+                temperature=dbs.get(
+                    "temperature_analysis_dic", self.temperature_analysis_dic
+                ),
+                salinity=dbs.get("salinity", self.salinity),
+            )
+
+    def _new_state(self):
+        state = {"count": 0, "weight": 0.0, "weight2": 0.0, "mean": np.nan, "m2": 0.0}
+        if self.window is not None:
+            state["values"] = deque()
+        if self.halflife is not None:
+            state["datenum"] = None
+        return state
+
+    def add(self, session, k_dic_here, datenum=None):
+        """Update the calibration factor for a session with one new CRM.
+
+        Parameters
+        ----------
+        session : any
+            The session that the CRM was measured in.
+        k_dic_here : float
+            The calibration factor from the CRM (see get_standard_calibrations).
+        datenum : float, optional
+            When the CRM was measured, required if using halflife.
+        """
+        if session not in self._state:
+            self._state[session] = self._new_state()
+        state = self._state[session]
+        weight = 1.0
+        if self.halflife is not None:
+            assert datenum is not None, "A datenum is needed with halflife."
+            if state["datenum"] is not None:
+                # Decay the weights of all the previous CRMs at once
+                decay = 2.0 ** -((datenum - state["datenum"]) / self.halflife)
+                state["weight"] *= decay
+                state["weight2"] *= decay**2
+                state["m2"] *= decay
+            state["datenum"] = datenum
+        elif self.window is not None:
+            state["values"].append(k_dic_here)
+            if len(state["values"]) > self.window:
+                # Remove the oldest CRM from the running statistics
+                old = state["values"].popleft()
+                state["count"] -= 1
+                state["weight"] -= 1
+                state["weight2"] -= 1
+                if state["count"] > 0:
+                    delta = old - state["mean"]
+                    state["mean"] -= delta / state["weight"]
+                    state["m2"] -= delta * (old - state["mean"])
+        state["count"] += 1
+        state["weight"] += weight
+        state["weight2"] += weight**2
+        if state["count"] == 1:
+            state["mean"] = k_dic_here
+            state["m2"] = 0.0
+        else:
+            delta = k_dic_here - state["mean"]
+            state["mean"] += delta * weight / state["weight"]
+            state["m2"] += weight * delta * (k_dic_here - state["mean"])
+
+    def add_standards(self, dbs):
+        """Update the calibration factors with newly measured CRMs.
+
+        Parameters
+        ----------
+        dbs : pd.DataFrame
+            The new rows of the dbs, having passed through blank_correction, with
+            dic_certified values for the CRMs.  Rows where k_dic_good is False (if
+            present) or with no dic_certified are skipped.
+        """
+        if "k_dic_here" in dbs:
+            k_dic_here = dbs.k_dic_here.values
+        else:
+            k_dic_here = (
+                dbs.dic_certified * self._density(dbs) / dbs.counts_corrected
+            ).values
+        if "k_dic_good" in dbs:
+            good = dbs.k_dic_good.values.astype(bool)
+        else:
+            good = ~dbs.dic_certified.isnull().values
+        good = good & ~np.isnan(k_dic_here)
+        if self.halflife is None:
+            datenums = itertools.repeat(None)
+        else:
+            datenums = dbs.datenum_analysis.values[good]
+        for session, k_dic_here, datenum in zip(
+            dbs[self.session_col].values[good], k_dic_here[good], datenums
+        ):
+            self.add(session, k_dic_here, datenum)
+
+    def k_dic(self, session):
+        """The current calibration factor for a session (NaN if it has no CRMs)."""
+        if session in self._state:
+            return self._state[session]["mean"]
+        else:
+            return np.nan
+
+    def calibrate(self, dbs):
+        """Calibrate DIC for new samples with the current calibration factors.
+
+        Parameters
+        ----------
+        dbs : pd.DataFrame
+            The new rows of the dbs, having passed through blank_correction.
+
+        Returns
+        -------
+        pd.Series
+            The calibrated DIC for each row, NaN where the session has no CRMs yet.
+        """
+        k_dic = np.array([self.k_dic(session) for session in dbs[self.session_col]])
+        return dbs.counts_corrected * k_dic / self._density(dbs)
+
+    @property
+    def sessions(self):
+        """The current calibration factors of all sessions."""
+        return pd.DataFrame(
+            {
+                "k_dic_mean": [s["mean"] for s in self._state.values()],
+                "k_dic_std": [
+                    (
+                        np.sqrt(s["m2"] / (s["weight"] - s["weight2"] / s["weight"]))
+                        if s["count"] > 1
+                        else np.nan
+                    )
+                    for s in self._state.values()
+                ],
+                "k_dic_count": [s["count"] for s in self._state.values()],
+            },
+            index=pd.Index(list(self._state), name=self.session_col),
+        )
@@ -0,0 +1,314 @@
+"""Run the whole VINDTA DIC processing chain with caching of intermediate stages."""
+
+import hashlib, os
+from collections import OrderedDict
+import numpy as np, pandas as pd
+from . import get
+from .read import LogfileTables, read_dbs, read_logfile
+
+
+def _update_hash(h, value):
+    """Add a parameter value or input dataset to hashlib object h."""
+    if isinstance(value, pd.DataFrame):
+        h.update(repr(list(value.columns)).encode())
+        _update_hash(h, value.index)
+        for column in value.columns:
+            _update_hash(h, value[column].values)
+    elif isinstance(value, (pd.Series, pd.Index)):
+        _update_hash(h, value.index if isinstance(value, pd.Series) else None)
+        _update_hash(h, value.values)
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.dtype, value.shape)).encode())
+        try:
+            h.update(pd.util.hash_array(value.ravel()).tobytes())
+        except TypeError:
+            # e.g. object arrays containing dicts or arrays
+            h.update(repr(value.tolist()).encode())
+    elif isinstance(value, LogfileTables):
+        for v in [
+            value.frame,
+            value.minutes,
+            value.counts,
+            value.increments,
+            value.offsets,
+        ]:
+            _update_hash(h, v)
+    elif isinstance(value, (list, tuple)):
+        h.update(b"[")
+        for v in value:
+            _update_hash(h, v)
+        h.update(b"]")
+    elif isinstance(value, dict):
+        _update_hash(h, sorted(value.items(), key=lambda item: str(item[0])))
+    else:
+        h.update(repr(value).encode())
+
+
+def _hash(*values):
+    """Hash a set of parameter values and/or datasets."""
+    h = hashlib.sha1()
+    for value in values:
+        _update_hash(h, value)
+    return h.hexdigest()
+
+
+class DicPipeline:
+    """VINDTA DIC processing, from importing files through to calibrated DIC, as a
+    chain of stages whose outputs are cached.
+
+    Each stage only depends on the outputs of earlier stages and on some of the
+    parameters, so when a parameter is changed with set(), only the stages that use
+    it and the stages after them are run again.  For example, changing use_from
+    reruns the blank stages and calibration, but not the import or logfile
+    matching, while changing dic_certified only reruns the calibration.
+
+    The stages, their upstream stages and the parameters they use are:
+
+      * "dbs": import the dbs file (drop_cols).
+      * "logfile": import the logfile (methods, ignore_lines).
+      * "logfile_index": match the dbs to the logfile ("dbs", "logfile").
+      * "sample_blanks": get_sample_blanks ("logfile_index", "logfile"; use_from,
+        use_to).
+      * "session_blanks": get_session_blanks ("sample_blanks"; session_col,
+        blank_start, blank_good).
+      * "counts_corrected": get_counts_corrected ("session_blanks"; blank_col,
+        counts_col, runtime_col).
+      * "density": get_density ("dbs"; temperature_analysis_dic, salinity).
+      * "calibration": calibrate_dic ("counts_corrected", "session_blanks",
+        "density"; dic_certified, k_dic_good).
+
+    The parameters blank_good, temperature_analysis_dic, salinity, dic_certified and
+    k_dic_good can be single values or arrays with one value per row of the dbs.  If
+    they are None, any existing column in the dbs with the same name is used, or
+    otherwise the defaults of the relevant koolstof.vindta.get functions.
+
+    Parameters
+    ----------
+    dbs : str or pd.DataFrame
+        The dbs file, either as a filename (and path) or already imported with
+        read_dbs.
+    logfile : str, pd.DataFrame or LogfileTables
+        The logfile, either as a filename (and path) or already imported with
+        read_logfile.
+    cache_size : int, optional
+        How many different outputs to cache for each stage, by default 8.
+    executor : str or concurrent.futures.Executor, optional
+        How to fit the session blanks; see get.get_session_blanks.
+    max_workers : int, optional
+        Maximum number of threads or processes for the executor, by default None.
+    **params
+        Initial values of any of the parameters listed above.
+
+    Attributes
+    ----------
+    computed : list
+        The stages that were actually computed (not taken from the cache) during the
+        most recent run.
+    """
+
+    defaults = {
+        "drop_cols": True,
+        "methods": "3C standard",
+        "ignore_lines": [],
+        "use_from": 6,
+        "use_to": 100,
+        "session_col": "dic_cell_id",
+        "blank_start": "default",
+        "blank_good": None,
+        "blank_col": "blank",
+        "counts_col": "counts",
+        "runtime_col": "run_time",
+        "temperature_analysis_dic": None,
+        "salinity": None,
+        "dic_certified": None,
+        "k_dic_good": None,
+    }
+    stages = OrderedDict(
+        [
+            ("dbs", ([], ["drop_cols"])),
+            ("logfile", ([], ["methods", "ignore_lines"])),
+            ("logfile_index", (["dbs", "logfile"], [])),
+            ("sample_blanks", (["logfile_index", "logfile"], ["use_from", "use_to"])),
+            (
+                "session_blanks",
+                (["sample_blanks"], ["session_col", "blank_start", "blank_good"]),
+            ),
+            (
+                "counts_corrected",
+                (["session_blanks"], ["blank_col", "counts_col", "runtime_col"]),
+            ),
+            ("density", (["dbs"], ["temperature_analysis_dic", "salinity"])),
+            (
+                "calibration",
+                (
+                    ["counts_corrected", "session_blanks", "density"],
+                    ["dic_certified", "k_dic_good"],
+                ),
+            ),
+        ]
+    )
+
+    def __init__(
+        self, dbs, logfile, cache_size=8, executor=None, max_workers=None, **params
+    ):
+        self.inputs = {"dbs": dbs, "logfile": logfile}
+        self.cache_size = cache_size
+        self.executor = executor
+        self.max_workers = max_workers
+        self.params = self.defaults.copy()
+        self.set(**params)
+        self.clear_cache()
+        self.computed = []
+
+    def set(self, **params):
+        """Change the value of one or more parameters."""
+        for k, v in params.items():
+            assert k in self.defaults, "Unknown parameter '{}'.".format(k)
+            self.params[k] = v
+
+    def clear_cache(self):
+        """Forget all cached stage outputs."""
+        self._cache = {stage: OrderedDict() for stage in self.stages}
+
+    def _input_key(self, stage):
+        """Get the key for an input file or dataset."""
+        value = self.inputs[stage]
+        if isinstance(value, str):
+            stat = os.stat(value)
+            return _hash(os.path.abspath(value), stat.st_size, stat.st_mtime_ns)
+        else:
+            return _hash(value)
+
+    def _column(self, dbs, column):
+        """Add a parameter to the dbs as a column, if it is not None."""
+        if self.params[column] is not None:
+            dbs[column] = self.params[column]
+
+    def _run_stage(self, stage, upstream):
+        p = self.params
+        if stage == "dbs":
+            if isinstance(self.inputs["dbs"], str):
+                return read_dbs(self.inputs["dbs"], drop_cols=p["drop_cols"])
+            else:
+                return self.inputs["dbs"].copy()
+        elif stage == "logfile":
+            if isinstance(self.inputs["logfile"], str):
+                return read_logfile(
+                    self.inputs["logfile"],
+                    methods=p["methods"],
+                    ignore_lines=p["ignore_lines"],
+                    ragged=True,
+                )
+            else:
+                return get._as_tables(self.inputs["logfile"])
+        elif stage == "logfile_index":
+            dbs, logfile = upstream
+            dbs = dbs.copy()
+            get.get_logfile_index(dbs, logfile)
+            return dbs
+        elif stage == "sample_blanks":
+            dbs, logfile = upstream
+            dbs = dbs.copy()
+            get.get_sample_blanks(
+                dbs, logfile, use_from=p["use_from"], use_to=p["use_to"]
+            )
+            return dbs
+        elif stage == "session_blanks":
+            dbs = upstream[0].copy()
+            self._column(dbs, "blank_good")
+            sessions = get.get_session_blanks(
+                dbs,
+                session_col=p["session_col"],
+                blank_start=p["blank_start"],
+                executor=self.executor,
+                max_workers=self.max_workers,
+            )
+            return dbs, sessions
+        elif stage == "counts_corrected":
+            dbs, sessions = upstream[0]
+            dbs = dbs.copy()
+            get.get_counts_corrected(
+                dbs,
+                sessions=sessions,
+                blank_col=p["blank_col"],
+                counts_col=p["counts_col"],
+                runtime_col=p["runtime_col"],
+                session_col=p["session_col"],
+            )
+            return dbs
+        elif stage == "density":
+            dbs = upstream[0].copy()
+            self._column(dbs, "temperature_analysis_dic")
+            self._column(dbs, "salinity")
+            get.get_density(dbs)
+            return dbs.density_analysis_dic
+        elif stage == "calibration":
+            dbs, (_, sessions), density = upstream
+            dbs = dbs.copy()
+            sessions = sessions.copy()
+            dbs["density_analysis_dic"] = density
+            self._column(dbs, "dic_certified")
+            self._column(dbs, "k_dic_good")
+            # Recalculate k_dic_here, which may be left over from an earlier
+            # calibration of the dbs input
+            get.get_standard_calibrations(dbs)
+            get.calibrate_dic(dbs, sessions)
+            return dbs, sessions
+
+    def _get(self, stage, keys):
+        """Get the key and output of a stage, computing it only if not cached."""
+        if stage not in keys:
+            upstream_stages, stage_params = self.stages[stage]
+            upstream = [self._get(u, keys) for u in upstream_stages]
+            if len(upstream_stages) == 0:
+                key = _hash(
+                    stage,
+                    self._input_key(stage),
+                    [self.params[k] for k in stage_params],
+                )
+            else:
+                key = _hash(
+                    stage,
+                    [u[0] for u in upstream],
+                    [self.params[k] for k in stage_params],
+                )
+            cache = self._cache[stage]
+            if key in cache:
+                cache.move_to_end(key)
+            else:
+                cache[key] = self._run_stage(stage, [u[1] for u in upstream])
+                self.computed.append(stage)
+                while len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+            keys[stage] = (key, cache[key])
+        return keys[stage]
+
+    def run(self, stage="calibration"):
+        """Run the pipeline up to and including a given stage.
+
+        Parameters
+        ----------
+        stage : str, optional
+            The final stage to run, by default "calibration".
+
+        Returns
+        -------
+        The output of the stage: the dbs (pd.DataFrame) for "dbs", "logfile_index",
+        "sample_blanks" and "counts_corrected"; a LogfileTables for "logfile"; the
+        dbs and sessions table for "session_blanks" and "calibration"; and a
+        pd.Series of densities for "density".  These are the cached objects, so
+        copy them before modifying them.
+        """
+        assert stage in self.stages, "Unknown stage '{}'.".format(stage)
+        self.computed = []
+        return self._get(stage, {})[1]
+
+    @property
+    def dbs(self):
+        """The fully processed and calibrated dbs."""
+        return self.run()[0].copy()
+
+    @property
+    def sessions(self):
+        """The table of analysis sessions with blank fits and calibration factors."""
+        return self.run()[1].copy()
@@ -1,9 +1,11 @@
 """Make figures to assist calibrating and QCing VINDTA datasets."""
 
 import itertools, copy
+from concurrent.futures import ProcessPoolExecutor
 from os import sep
 import numpy as np
 from matplotlib import pyplot as plt, dates as mdates
+from matplotlib.collections import LineCollection
 from . import get, process
 from ..plot import add_credit
 from ..meta import __version__
@@ -42,36 +44,46 @@ def plot_increments(
         fig, ax = plt.subplots(dpi=dpi, figsize=figsize)
     else:
         fig = ax.get_figure()
-    fymax = 1.0
-    for i in dbs[dbs.logfile_index.notnull()].logfile_index:
-        i_data = logfile.table[i]
-        i_blank = (i_data["minutes"] >= use_from) & (i_data["minutes"] <= use_to)
-        ax.plot(
-            i_data["minutes"],
-            i_data["increments"],
-            c="xkcd:almost black",
+    tables = get._as_tables(logfile)
+    # Gather the tables of all matched titrations into flat arrays
+    ix = tables.locate(dbs.logfile_index)
+    ix = ix[ix >= 0]
+    lengths = tables.lengths[ix]
+    starts = tables.offsets[ix]
+    flat_starts = np.cumsum(lengths) - lengths
+    flat = np.repeat(starts - flat_starts, lengths) + np.arange(np.sum(lengths))
+    minutes = tables.minutes[flat]
+    increments = tables.increments[flat]
+    # Draw all the titrations at once, with one artist for each type of point
+    ax.add_collection(
+        LineCollection(
+            np.split(np.column_stack([minutes, increments]), flat_starts[1:]),
+            colors="xkcd:almost black",
             alpha=0.1,
         )
+    )
+    blank = (minutes >= use_from) & (minutes <= use_to)
+    not_blank = (minutes < use_from) | (minutes > use_to)
+    for l, c in ((blank, "xkcd:strawberry"), (not_blank, "xkcd:navy")):
         ax.scatter(
-            i_data["minutes"][i_blank],
-            i_data["increments"][i_blank],
-            alpha=alpha,
-            c="xkcd:strawberry",
-            clip_on=False,
-            edgecolor="none",
-            s=20,
-        )
-        fymax = np.max([fymax, np.max(i_data["increments"][-3:])])
-        not_i_blank = (i_data["minutes"] < use_from) | (i_data["minutes"] > use_to)
-        ax.scatter(
-            i_data["minutes"][not_i_blank],
-            i_data["increments"][not_i_blank],
+            minutes[l],
+            increments[l],
             alpha=alpha,
-            c="xkcd:navy",
+            c=c,
             clip_on=False,
             edgecolor="none",
             s=20,
         )
+    # Scale the y-axis to the final three increments of each titration
+    tails = (starts + lengths)[:, np.newaxis] - np.arange(1, 4)
+    fymax = np.max(
+        np.where(
+            tails >= starts[:, np.newaxis],
+            tables.increments[np.maximum(tails, 0)],
+            1.0,
+        ),
+        initial=1.0,
+    )
     ax.set_xlim([0, dbs.run_time.max() + 0.5])
     ax.set_ylim([0, fymax * 1.2])
     ax.set_xlabel("Run time / minutes")
@@ -198,7 +210,14 @@ def plot_session_blanks(
     return fig, ax
 
 
-def plot_blanks(dbs, sessions, figure_dir=None, **kwargs):
+def _plot_session_blanks_agg(dbs, sessions, session, kwargs):
+    """[process pool] Draw and save one session's blanks with the Agg backend."""
+    plt.switch_backend("Agg")
+    fig, ax = plot_session_blanks(dbs, sessions, session, show_fig=False, **kwargs)
+    plt.close(fig)
+
+
+def plot_blanks(dbs, sessions, figure_dir=None, processes=1, **kwargs):
     """Draw sample blanks and their fit for all analysis sessions.
 
     Parameters
@@ -208,12 +227,38 @@ def plot_blanks(dbs, sessions, figure_dir=None, **kwargs):
         corrections applied.
     sessions : pd.DataFrame
         A table with blank fit data for each analysis session.
+    processes : int, optional
+        The maximum number of processes for drawing the figures, by default 1, in
+        which case they are drawn one by one.  If None, it is the number of CPUs.
+        With more than one process, the figures are drawn with the non-interactive
+        Agg backend and not shown, so figure_path must be provided to save them.
     kwargs
         Passed on to plot_session_blanks().
     """
-    for session in sessions[sessions.blank_mean.notnull()].index:
-        fig, ax = plot_session_blanks(dbs, sessions, session, **kwargs)
-        plt.close(fig)
+    session_list = sessions[sessions.blank_mean.notnull()].index
+    if processes == 1:
+        for session in session_list:
+            fig, ax = plot_session_blanks(dbs, sessions, session, **kwargs)
+            plt.close(fig)
+    else:
+        assert (
+            kwargs.get("figure_path") is not None
+        ), "figure_path must be provided when drawing in parallel."
+        kwargs.pop("show_fig", None)
+        session_col = sessions.index.name
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(
+                    _plot_session_blanks_agg,
+                    dbs[dbs[session_col] == session],
+                    sessions.loc[[session]],
+                    session,
+                    kwargs,
+                )
+                for session in session_list
+            ]
+            for future in futures:
+                future.result()
 
 
 # def blanks(dbs, dic_sessions, ax=None, title=None, alpha=0.5, **kwargs):
@@ -1,40 +1,73 @@
-import numpy as np
+import numpy as np, pandas as pd
 
 
-def get_data_index(dbs_row, data):
-    """Get index of data in dbs to transfer metadata across for processing."""
-    if dbs_row.bottle in data.station_bottleid.values:
-        data_iloc = np.where(dbs_row.bottle == data.station_bottleid.values)[0]
-        assert (
-            len(data_iloc) == 1
-        ), "Found more than one bottle ID match for {}!".format(dbs_row.bottle)
-        data_index = data.index[data_iloc[0]]
+def get_data_index(dbs, data):
+    """Get index of data in dbs to transfer metadata across for processing.
+
+    Parameters
+    ----------
+    dbs : pd.DataFrame or pd.Series
+        The dbs, or a single row of it (e.g. with dbs.apply(..., axis=1)).
+    data : pd.DataFrame
+        The sample data table, with bottle IDs in its "station_bottleid" column.
+
+    Returns
+    -------
+    pd.Series or scalar
+        The index of data matching each row of the dbs, with NaN where there is no
+        match (or just the index for a single row).
+    """
+    single = isinstance(dbs, pd.Series)
+    dbs_bottle = pd.Series([dbs.bottle]) if single else dbs.bottle
+    data_bottle = data.station_bottleid
+    # Bottle IDs that are in data more than once can't be matched to the dbs
+    duplicated = data_bottle.duplicated(keep=False).values
+    matched_duplicates = dbs_bottle[dbs_bottle.isin(data_bottle.values[duplicated])]
+    assert (
+        len(matched_duplicates) == 0
+    ), "Found more than one bottle ID match for {}!".format(matched_duplicates.iloc[0])
+    data_iloc = pd.Index(data_bottle.values[~duplicated]).get_indexer(dbs_bottle)
+    # Reindexing with -1 (no match) gives NaN
+    data_index = pd.Series(data.index[~duplicated]).reindex(data_iloc).values
+    if single:
+        return data_index[0]
     else:
-        data_index = np.nan
-    return data_index
+        return pd.Series(data_index, index=dbs.index)
 
 
 def dbs2data(dbs, data, fields):
     """Transfer results from dbs into data, taking means for duplicates."""
     if isinstance(fields, str):
         fields = [fields]
+    # Group the dbs rows by bottle and find the group for each row of data
+    bottle_codes, bottles = pd.factorize(dbs.bottle)
+    n_bottles = len(bottles)
+    data_code = pd.Index(bottles).get_indexer(data.station_bottleid)
+    in_dbs = data_code >= 0
     for field in fields:
+        good = dbs[field + "_good"].values.astype(bool) & (bottle_codes >= 0)
+        values = dbs[field].values.astype(float)
+        # NaN replicates are counted but skipped in the mean and std
+        count = np.bincount(bottle_codes[good], minlength=n_bottles)
+        valid = good & ~np.isnan(values)
+        codes = bottle_codes[valid]
+        values = values[valid]
+        count_valid = np.bincount(codes, minlength=n_bottles)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(codes, weights=values, minlength=n_bottles) / count_valid
+            std = np.sqrt(
+                np.bincount(
+                    codes, weights=(values - mean[codes]) ** 2, minlength=n_bottles
+                )
+                / count_valid
+            )
+        std[count < 2] = np.nan
         data[field] = np.nan
         data[field + "_std"] = np.nan
         data[field + "_count"] = 0
-    for row in data.index:
-        dr = data.loc[row]
-        if dr.station_bottleid in dbs.bottle.values:
-            for field in fields:
-                dbs_iloc = np.where(
-                    (dr.station_bottleid == dbs.bottle.values) & dbs[field + "_good"]
-                )[0]
-                if np.size(dbs_iloc) > 0:
-                    fdata = dbs.iloc[dbs_iloc][field]
-                    data.loc[row, field] = np.mean(fdata)
-                    if np.size(dbs_iloc) > 1:
-                        data.loc[row, field + "_std"] = np.std(fdata)
-                    data.loc[row, field + "_count"] = np.size(dbs_iloc)
+        data.loc[in_dbs, field] = mean[data_code[in_dbs]]
+        data.loc[in_dbs, field + "_std"] = std[data_code[in_dbs]]
+        data.loc[in_dbs, field + "_count"] = count[data_code[in_dbs]]
     return data
 
 
@@ -1,11 +1,423 @@
-import re
+import copy, glob, hashlib, locale, os, re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np, pandas as pd
 from matplotlib import dates as mdates
+from ..misc import dbs_datetime
 
 
-def read_logfile(fname, methods="3C standard", ignore_lines=[]):
+class _LogfileParser:
+    """Streaming state machine that parses a logfile.bak one line at a time.
+
+    Each titration is appended to growable columnar buffers as soon as its
+    increments table ends, so only the output (and never the whole text of the
+    logfile) is held in memory.  All titration tables are stored end to end in flat
+    arrays, with `offsets` marking where each one starts.
+    """
+
+    def __init__(self, methods="3C standard", ignore_lines=[], line_number=0):
+        if isinstance(methods, str):
+            methods = [methods]
+        self.ignore_lines = ignore_lines
+        # Compile regexs for reading logfile
+        self.re_method = re.compile(r"(" + r"|".join(methods) + r")\.mth run started ")
+        self.re_datetime = re.compile(
+            r"started (\d{2})/(\d{2})/(\d{2})  (\d{2}):(\d{2})"
+        )
+        self.re_bottle = re.compile(r"(bottle)?\t([^\t]*)\t")
+        self.re_crm = re.compile(r"CRM\t([^\t]*)\t")
+        self.re_increments = re.compile(r"(\d*)\t(\d*)\t(\d*)\t")
+        # Number of the next line to be parsed
+        self.line_number = line_number
+        # The titration currently being parsed, if any
+        self.current = None
+        # Columnar buffers for the output
+        self.columns = {
+            "line_number": [],
+            "datetime_analysis": [],
+            "bottle": [],
+            "counts": [],
+            "run_time": [],
+            "method": [],
+        }
+        self.minutes = array("d")
+        self.counts = array("d")
+        self.increments = array("d")
+        self.offsets = [0]
+
+    def feed(self, line):
+        """Parse the next line of the logfile (without its line ending)."""
+        i = self.line_number
+        self.line_number += 1
+        current = self.current
+        if current is not None:
+            step = i - current["line_number"]
+            if step == 1:
+                # Get sample name
+                if self.re_bottle.match(line):
+                    current["bottle"] = self.re_bottle.match(line).group(2)
+                elif self.re_crm.match(line):
+                    current["bottle"] = self.re_crm.match(line).group(1)
+                elif line == "other":
+                    current["bottle"] = "other_{}".format(i)
+                if current["bottle"] is None:
+                    if i not in self.ignore_lines:
+                        print("Logfile line {}: bottle name not found!".format(i))
+                    self.current = None
+                else:
+                    self.minutes.append(0.0)
+                    self.counts.append(0.0)
+                    self.increments.append(0.0)
+            elif step >= 4:
+                # Get coulometer data
+                increments = self.re_increments.match(line.strip())
+                if increments:
+                    self.minutes.append(float(increments.group(1)))
+                    self.counts.append(float(increments.group(2)))
+                    self.increments.append(float(increments.group(3)))
+                    return
+                self._close()
+        method = self.re_method.match(line)
+        if method:
+            if self.current is not None:
+                self._close()
+            # Get analysis date and time
+            ldt = self.re_datetime.findall(line)[0]
+            self.current = {
+                "line_number": i,
+                "method": method.group(1),
+                "datetime_analysis": "{}-{}-{}T{}:{}".format(
+                    "20" + ldt[2], ldt[0], ldt[1], ldt[3], ldt[4]
+                ),
+                "bottle": None,
+            }
+
+    def _close(self):
+        """Finish the current titration and append it to the output buffers."""
+        current = self.current
+        self.current = None
+        if current["bottle"] is None:
+            # The file ended before the bottle line was reached
+            return
+        for k in ["line_number", "datetime_analysis", "bottle", "method"]:
+            self.columns[k].append(current[k])
+        self.columns["counts"].append(self.counts[-1])
+        self.columns["run_time"].append(len(self.minutes) - self.offsets[-1] - 1.0)
+        self.offsets.append(len(self.minutes))
+
+    def close(self):
+        """Finish parsing at the end of the file."""
+        if self.current is not None:
+            self._close()
+
+    def to_tables(self):
+        """Convert the parsed logfile into a LogfileTables object."""
+        frame = pd.DataFrame(
+            {
+                "line_number": np.array(self.columns["line_number"], dtype=int),
+                "datetime_analysis": np.array(
+                    self.columns["datetime_analysis"], dtype="datetime64[m]"
+                ),
+                "bottle": np.array(self.columns["bottle"]),
+                "counts": np.array(self.columns["counts"]),
+                "run_time": np.array(self.columns["run_time"]),
+                "method": np.array(self.columns["method"]),
+            }
+        ).set_index("line_number")
+        end = self.offsets[-1]
+        return LogfileTables(
+            frame,
+            np.frombuffer(self.minutes, dtype=float)[:end].copy(),
+            np.frombuffer(self.counts, dtype=float)[:end].copy(),
+            np.frombuffer(self.increments, dtype=float)[:end].copy(),
+            np.array(self.offsets),
+        )
+
+    def flush(self):
+        """Return the titrations completed so far as a LogfileTables and clear them
+        from the buffers, keeping the titration currently being parsed (if any).
+        """
+        tables = self.to_tables()
+        end = self.offsets[-1]
+        for buffer in [self.minutes, self.counts, self.increments]:
+            del buffer[:end]
+        for column in self.columns.values():
+            column.clear()
+        self.offsets = [0]
+        return tables
+
+    def to_frame(self):
+        """Convert the parsed logfile into a DataFrame with one row per titration."""
+        return self.to_tables().to_logfile()
+
+
+class LogfileTables:
+    """All titrations from a logfile.bak with their tables stored in flat arrays.
+
+    Rather than one dict of small arrays per titration, the minutes, counts and
+    increments of every titration table are concatenated end to end (like a CSR
+    sparse matrix), with the table for the titration at integer position `i` found
+    between `offsets[i]` and `offsets[i + 1]`.  This can be passed instead of the
+    logfile DataFrame to the functions in koolstof.vindta.get.
+
+    Parameters
+    ----------
+    frame : pd.DataFrame
+        The logfile without its "table" column, indexed by line number.
+    minutes, counts, increments : np.ndarray
+        The concatenated titration tables.
+    offsets : np.ndarray
+        Where each titration table starts in the flat arrays, with one extra final
+        value for where the last one ends.
+    """
+
+    def __init__(self, frame, minutes, counts, increments, offsets):
+        self.frame = frame
+        self.minutes = minutes
+        self.counts = counts
+        self.increments = increments
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def lengths(self):
+        """Number of rows in each titration table."""
+        return np.diff(self.offsets)
+
+    @property
+    def segment_ids(self):
+        """Integer position of the titration that each flat table row belongs to."""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def locate(self, logfile_index):
+        """Get the integer positions of the titrations at the given logfile indices,
+        with -1 wherever there is no match (e.g. if the index is NaN).
+        """
+        return self.frame.index.get_indexer(
+            pd.Index(np.asarray(logfile_index, dtype=float))
+        )
+
+    def table(self, logfile_index):
+        """Get the table for one titration as a dict, like logfile.table[index]."""
+        i = self.frame.index.get_loc(logfile_index)
+        s = slice(self.offsets[i], self.offsets[i + 1])
+        return {
+            "minutes": self.minutes[s],
+            "counts": self.counts[s],
+            "increments": self.increments[s],
+        }
+
+    @classmethod
+    def from_logfile(cls, logfile):
+        """Create from a logfile DataFrame (imported with read_logfile)."""
+        tables = logfile.table.values
+        offsets = np.zeros(len(tables) + 1, dtype=int)
+        offsets[1:] = np.cumsum([len(t["minutes"]) for t in tables])
+        flat = {
+            k: np.concatenate([t[k] for t in tables]) if len(tables) else np.array([])
+            for k in ["minutes", "counts", "increments"]
+        }
+        return cls(
+            logfile.drop(columns="table"),
+            flat["minutes"],
+            flat["counts"],
+            flat["increments"],
+            offsets,
+        )
+
+    @classmethod
+    def concat(cls, tables):
+        """Join a list of LogfileTables together end to end."""
+        offsets = [np.zeros(1, dtype=int)]
+        start = 0
+        for t in tables:
+            offsets.append(t.offsets[1:] + start)
+            start += t.offsets[-1]
+        frames = [t.frame for t in tables if len(t) > 0]
+        if len(frames) == 0:
+            frames = [tables[0].frame]
+        return cls(
+            pd.concat(frames),
+            np.concatenate([t.minutes for t in tables]),
+            np.concatenate([t.counts for t in tables]),
+            np.concatenate([t.increments for t in tables]),
+            np.concatenate(offsets),
+        )
+
+    def to_logfile(self):
+        """Convert into a logfile DataFrame, as returned by read_logfile."""
+        splits = self.offsets[1:-1]
+        tables = np.empty(len(self), dtype=object)
+        if len(tables) > 0:
+            tables[:] = [
+                {"minutes": m, "counts": c, "increments": n}
+                for m, c, n in zip(
+                    np.split(self.minutes, splits),
+                    np.split(self.counts, splits),
+                    np.split(self.increments, splits),
+                )
+            ]
+        logfile = self.frame.copy()
+        if "bottle" in logfile:
+            logfile.insert(logfile.columns.get_loc("bottle") + 1, "table", tables)
+        else:
+            logfile["table"] = tables
+        return logfile
+
+
+class ParseCache:
+    """Cache of imported logfiles and dbs files on disk.
+
+    Each file is stored the first time it is imported, keyed by its path, size and
+    modification time together with the import settings.  Later imports of the same
+    unchanged file then just reload the stored binary copy instead of parsing the
+    text again.  Logfiles are stored as an npz bundle of their LogfileTables arrays
+    and dbs files as pickled DataFrames.  When the cache grows beyond `max_bytes`,
+    the least recently used files are deleted.
+
+    Parameters
+    ----------
+    path : str
+        The directory to keep the cache in, which is created if it does not exist.
+    max_bytes : int, optional
+        The maximum total size of the cache in bytes, by default 512 MiB.
+    """
+
+    version = 1
+
+    def __init__(self, path, max_bytes=2**29):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def _fname(self, kind, fname, settings):
+        """Get the cache filename for a file imported with the given settings."""
+        stat = os.stat(fname)
+        key = repr(
+            (
+                self.version,
+                kind,
+                os.path.abspath(fname),
+                stat.st_size,
+                stat.st_mtime_ns,
+                settings,
+            )
+        )
+        extension = ".npz" if kind == "logfile" else ".pkl"
+        return os.path.join(
+            self.path, hashlib.sha1(key.encode()).hexdigest() + extension
+        )
+
+    def _files(self):
+        return [
+            os.path.join(self.path, f)
+            for f in os.listdir(self.path)
+            if f.endswith((".npz", ".pkl"))
+        ]
+
+    def _evict(self):
+        """Delete the least recently used files until the cache fits in max_bytes."""
+        files = []
+        for f in self._files():
+            try:
+                stat = os.stat(f)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, f))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, f in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Delete everything in the cache."""
+        for f in self._files():
+            os.remove(f)
+
+    def load(self, kind, fname, settings):
+        """Get a file from the cache, or None if it is not there."""
+        cache_fname = self._fname(kind, fname, settings)
+        try:
+            if kind == "logfile":
+                with np.load(cache_fname) as npz:
+                    data = {k: npz[k] for k in npz.files}
+            else:
+                data = pd.read_pickle(cache_fname)
+        except (FileNotFoundError, EOFError, OSError, ValueError):
+            return None
+        # Mark as recently used
+        os.utime(cache_fname)
+        if kind == "logfile":
+            names = data.pop("names")
+            frame = pd.DataFrame(
+                {
+                    name: data.pop("column{}".format(i))
+                    for i, name in enumerate(names[1:])
+                },
+                index=pd.Index(data.pop("index"), name=names[0] or None),
+            )
+            for column in frame.columns:
+                if frame[column].dtype.kind == "U":
+                    frame[column] = frame[column].astype(object)
+            data = LogfileTables(frame, **data)
+        return data
+
+    def store(self, kind, fname, settings, data):
+        """Put an imported file into the cache."""
+        cache_fname = self._fname(kind, fname, settings)
+        temp_fname = "{}.{}.tmp".format(cache_fname, os.getpid())
+        if kind == "logfile":
+            frame = data.frame
+            columns = {
+                "column{}".format(i): (
+                    frame[column].values.astype(str)
+                    if frame[column].dtype == object
+                    else frame[column].values
+                )
+                for i, column in enumerate(frame.columns)
+            }
+            with open(temp_fname, "wb") as f:
+                np.savez(
+                    f,
+                    names=np.array([frame.index.name or ""] + list(frame.columns)),
+                    index=frame.index.values,
+                    minutes=data.minutes,
+                    counts=data.counts,
+                    increments=data.increments,
+                    offsets=data.offsets,
+                    **columns,
+                )
+        else:
+            pd.to_pickle(data, temp_fname, compression=None)
+        os.replace(temp_fname, cache_fname)
+        self._evict()
+
+
+def _as_cache(cache):
+    """Convert the cache kwarg of the import functions into a ParseCache."""
+    if cache is None or isinstance(cache, ParseCache):
+        return cache
+    else:
+        return ParseCache(cache)
+
+
+def read_logfile(
+    fname, methods="3C standard", ignore_lines=[], ragged=False, cache=None
+):
     """Import a logfile.bak as a DataFrame.
 
+    The file is parsed in a single pass, one line at a time, so the time taken scales
+    linearly with the length of the logfile.
+
     Parameters
     ----------
     fname : str
@@ -15,76 +427,146 @@ def read_logfile(fname, methods="3C standard", ignore_lines=[]):
         "3C standard".
     ignore_lines : list, optional
         Which line numbers of the logfile to ignore, by default [].
+    ragged : bool, optional
+        Whether to return the titration tables concatenated into flat arrays as a
+        LogfileTables object (True) or as a DataFrame with a dict for each table in
+        its "table" column (False), by default False.
+    cache : str or ParseCache, optional
+        A ParseCache, or the directory for one, in which to store the imported
+        logfile so that it can be reloaded quickly next time, by default None (no
+        caching).
 
     Returns
     -------
-    pd.DataFrame
-        The logfile as a pandas DataFrame.
+    pd.DataFrame or LogfileTables
+        The logfile as a pandas DataFrame (or as a LogfileTables, if ragged).
     """
-    if isinstance(methods, str):
-        methods = [methods]
-    # Compile regexs for reading logfile
-    re_method = re.compile(r"(" + r"|".join(methods) + r")\.mth run started ")
-    re_datetime = re.compile(r"started (\d{2})/(\d{2})/(\d{2})  (\d{2}):(\d{2})")
-    re_bottle = re.compile(r"(bottle)?\t([^\t]*)\t")
-    re_crm = re.compile(r"CRM\t([^\t]*)\t")
-    re_increments = re.compile(r"(\d*)\t(\d*)\t(\d*)\t")
-    # Import text from logfile
-    with open(fname, "r") as f:
-        logf = f.read().splitlines()
-    # Initialise arrays
-    logdf = {
-        "line_number": [],
-        "datetime_analysis": np.array([], dtype="datetime64"),
-        "bottle": [],
-        "table": [],
-        "counts": [],
-        "run_time": [],
-        "method": [],
-    }
-    # Parse file line by line
-    for i, line in enumerate(logf):
-        if re_method.match(line):
-            # Get sample name
-            lbot = 0
-            if re_bottle.match(logf[i + 1]):
-                lbot = re_bottle.findall(logf[i + 1])[0][1]
-            elif re_crm.match(logf[i + 1]):
-                lbot = re_crm.findall(logf[i + 1])[0]
-            elif logf[i + 1] == "other":
-                lbot = "other_{}".format(i + 1)
-            if type(lbot) == str:
-                logdf["bottle"].append(lbot)
-                logdf["line_number"].append(i)
-                logdf["method"].append(re_method.findall(line)[0])
-                # Get analysis date and time
-                ldt = re_datetime.findall(line)[0]
-                ldt = np.datetime64(
-                    "{}-{}-{}T{}:{}".format(
-                        "20" + ldt[2], ldt[0], ldt[1], ldt[3], ldt[4]
-                    )
-                )
-                logdf["datetime_analysis"] = np.append(logdf["datetime_analysis"], ldt)
-                # Get coulometer data
-                jdict = {"minutes": [0.0], "counts": [0.0], "increments": [0.0]}
-                j = 4
-                while re_increments.match(logf[i + j].strip()):
-                    jinc = re_increments.findall(logf[i + j].strip())[0]
-                    jdict["minutes"].append(float(jinc[0]))
-                    jdict["counts"].append(float(jinc[1]))
-                    jdict["increments"].append(float(jinc[2]))
-                    j += 1
-                jdict = {k: np.array(v) for k, v in jdict.items()}
-                logdf["table"].append(jdict)
-                logdf["counts"].append(jdict["counts"][-1])
-                logdf["run_time"].append(j - 4.0)
-            else:
-                if i + 1 not in ignore_lines:
-                    print("Logfile line {}: bottle name not found!".format(i + 1))
-    # Convert lists to arrays and put logfile into DataFrame
-    logdf = pd.DataFrame({k: np.array(v) for k, v in logdf.items()})
-    logdf.set_index("line_number", inplace=True)
-    return logdf
+    cache = _as_cache(cache)
+    tables = None
+    if cache is not None:
+        settings = (methods, sorted(ignore_lines))
+        tables = cache.load("logfile", fname, settings)
+    if tables is None:
+        parser = _LogfileParser(methods=methods, ignore_lines=set(ignore_lines))
+        with open(fname, "r") as f:
+            for line in f:
+                parser.feed(line.rstrip("\r\n"))
+        parser.close()
+        tables = parser.to_tables()
+        if cache is not None:
+            cache.store("logfile", fname, settings, tables)
+    if ragged:
+        return tables
+    else:
+        return tables.to_logfile()
+
+
+def _concat_logfiles(logfiles):
+    """Join logfile DataFrames or LogfileTables together end to end."""
+    if isinstance(logfiles[0], LogfileTables):
+        return LogfileTables.concat(logfiles)
+    else:
+        nonempty = [logfile for logfile in logfiles if len(logfile) > 0]
+        if len(nonempty) == 0:
+            return logfiles[0]
+        return pd.concat(nonempty)
+
+
+class LogfileFollower:
+    """Follow a logfile.bak that is still being appended to, e.g. during a live run.
+
+    Each call to update() parses only the lines added to the file since the
+    previous call and merges the new titrations into the logfile, so the cost of a
+    refresh scales with the amount of new data, not with the length of the file.
+    The parser state is kept between updates, so the titration currently being run
+    is included as it stands and completed at later updates.
+
+    If the file shrinks or is replaced, it is read again from the start.
+
+    Parameters
+    ----------
+    fname : str
+        The filename (and path) of the logfile.
+    methods : str or list, optional
+        VINDTA method name or list of names used for measurements, by default
+        "3C standard".
+    ignore_lines : list, optional
+        Which line numbers of the logfile to ignore, by default [].
+    ragged : bool, optional
+        Whether the logfile should be a LogfileTables (True) or a DataFrame (False),
+        by default False.
+    encoding : str, optional
+        Text encoding of the logfile, by default None, in which case the same default
+        as for open() is used.
+
+    Attributes
+    ----------
+    logfile : pd.DataFrame or LogfileTables
+        The logfile as of the most recent update.
+    offset : int
+        The byte offset in the file up to which lines have been parsed.
+    """
+
+    def __init__(
+        self, fname, methods="3C standard", ignore_lines=[], ragged=False, encoding=None
+    ):
+        self.fname = fname
+        self.methods = methods
+        self.ignore_lines = set(ignore_lines)
+        self.ragged = ragged
+        if encoding is None:
+            encoding = locale.getpreferredencoding(False)
+        self.encoding = encoding
+        self.reset()
+
+    def reset(self):
+        """Forget everything parsed so far."""
+        self._parser = _LogfileParser(
+            methods=self.methods, ignore_lines=self.ignore_lines
+        )
+        self._completed = self._convert(self._parser.to_tables())
+        self._inode = None
+        self.offset = 0
+        self.logfile = self._completed
+
+    def _convert(self, tables):
+        if self.ragged:
+            return tables
+        else:
+            return tables.to_logfile()
+
+    def update(self):
+        """Parse any new lines in the logfile and return the updated logfile.
+
+        Returns
+        -------
+        pd.DataFrame or LogfileTables
+            The logfile including all titrations parsed so far.
+        """
+        stat = os.stat(self.fname)
+        if self._inode is not None and (
+            stat.st_ino != self._inode or stat.st_size < self.offset
+        ):
+            self.reset()
+        self._inode = stat.st_ino
+        with open(self.fname, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # The final line is still being written, so leave it for later
+                    break
+                self.offset += len(line)
+                self._parser.feed(line.rstrip(b"\r\n").decode(self.encoding))
+        self._completed = _concat_logfiles(
+            [self._completed, self._convert(self._parser.flush())]
+        )
+        # Add the titration still in progress without changing the parser state
+        current = copy.deepcopy(self._parser)
+        current.close()
+        self.logfile = _concat_logfiles(
+            [self._completed, self._convert(current.to_tables())]
+        )
+        return self.logfile
 
 
 # More Python-friendly names for the .dbs columns
@@ -143,23 +625,7 @@ _dbs_drop = [
 ]
 
 
-def _dbs_datetime(dbs_row):
-    """[row.apply] Convert date and time from dbs file into a datetime."""
-    try:
-        dspl = dbs_row["date"].split("/")
-        datetime_analysis = np.datetime64(
-            "-".join(("20" + dspl[2], dspl[0], dspl[1])) + "T" + dbs_row["time"]
-        )
-    except AttributeError:
-        datetime_analysis = np.datetime64("NaT")
-    return pd.Series(
-        {
-            "datetime_analysis": datetime_analysis,
-        }
-    )
-
-
-def read_dbs(fname, drop_cols=True):
+def read_dbs(fname, drop_cols=True, time_format="%H:%M", cache=None):
     """Import a dbs file from a VINDTA, rename the columns, and reformat the date/time.
 
     Parameters
@@ -168,21 +634,134 @@ def read_dbs(fname, drop_cols=True):
         The filename (and path) of the dbs file.
     drop_cols : bool, optional
         Whether to drop superfluous columns (True) or not (False), by default True.
+    time_format : str, optional
+        Format of the analysis times, by default "%H:%M" (see misc.dbs_datetime).
+    cache : str or ParseCache, optional
+        A ParseCache, or the directory for one, in which to store the imported dbs
+        so that it can be reloaded quickly next time, by default None (no caching).
 
     Returns
     -------
     pd.DataFrame
         The dbs file as a pandas DataFrame.
     """
+    cache = _as_cache(cache)
+    if cache is not None:
+        dbs = cache.load("dbs", fname, (drop_cols, time_format))
+        if dbs is not None:
+            dbs["dbs_fname"] = fname
+            return dbs
     # Import the dbs file and rename columns
     headers = np.genfromtxt(fname, delimiter="\t", dtype=str, max_rows=1)
     dbs = pd.read_table(fname, header=0, names=headers, usecols=headers)
     dbs = dbs.rename(columns=_dbs_mapper)
     dbs["dbs_fname"] = fname
     # Reformat the date and time
-    dbs = dbs.assign(**dbs.apply(_dbs_datetime, axis=1))
+    dbs["datetime_analysis"] = dbs_datetime(dbs.date, dbs.time, time_format)
     dbs["datenum_analysis"] = mdates.date2num(dbs.datetime_analysis)
     # Drop superfluous columns, if requested (by default, do this)
     if drop_cols:
         dbs.drop(columns=_dbs_drop, inplace=True)
+    if cache is not None:
+        cache.store("dbs", fname, (drop_cols, time_format), dbs)
     return dbs
+
+
+def _get_fnames(fnames):
+    """Expand a glob pattern or list of glob patterns into a list of filenames."""
+    if isinstance(fnames, str):
+        fnames = [fnames]
+    expanded = []
+    for fname in fnames:
+        matches = sorted(glob.glob(fname))
+        assert len(matches) > 0, "No files found matching '{}'.".format(fname)
+        expanded += matches
+    return expanded
+
+
+def _read_logfile_batch(fname, methods, ignore_lines, cache=None):
+    """Import one logfile for read_batch, tagged with its filename."""
+    tables = read_logfile(
+        fname, methods=methods, ignore_lines=ignore_lines, ragged=True, cache=cache
+    )
+    tables.frame = tables.frame.reset_index()
+    tables.frame["logfile_fname"] = fname
+    return tables
+
+
+def read_batch(
+    dbs_fnames,
+    logfile_fnames,
+    methods="3C standard",
+    ignore_lines={},
+    drop_cols=True,
+    ragged=False,
+    processes=None,
+    cache=None,
+):
+    """Import and concatenate a set of dbs files and logfiles, parsing them in
+    parallel.
+
+    Every file is imported in a separate process, so a whole campaign can be read
+    using all the available cores.  The logfiles are concatenated with a new unique
+    index, with the original line numbers and filenames in the columns
+    "line_number" and "logfile_fname".  Samples from all the dbs files can then be
+    matched to all the logfiles at once with the functions in koolstof.vindta.get.
+
+    Parameters
+    ----------
+    dbs_fnames : str or list
+        The filenames (and paths) of the dbs files, which may include wildcards.
+    logfile_fnames : str or list
+        The filenames (and paths) of the logfiles, which may include wildcards.
+    methods : str or list, optional
+        VINDTA method name or list of names used for measurements, by default
+        "3C standard".
+    ignore_lines : dict, optional
+        Which line numbers to ignore in each logfile, with the logfile filenames as
+        keys and lists of line numbers as values, by default {}.
+    drop_cols : bool, optional
+        Whether to drop superfluous columns from the dbs (True) or not (False), by
+        default True.
+    ragged : bool, optional
+        Whether to return the logfile as a LogfileTables (True) or as a DataFrame
+        (False), by default False.
+    processes : int, optional
+        The maximum number of processes to use, by default None, in which case it is
+        the number of CPUs.  If 1, the files are imported one by one without
+        starting any extra processes.
+    cache : str or ParseCache, optional
+        A ParseCache, or the directory for one, in which to store the imported files
+        so that they can be reloaded quickly next time, by default None (no
+        caching).
+
+    Returns
+    -------
+    dbs : pd.DataFrame
+        All the dbs files as one DataFrame.
+    logfile : pd.DataFrame or LogfileTables
+        All the logfiles together.
+    """
+    dbs_fnames = _get_fnames(dbs_fnames)
+    logfile_fnames = _get_fnames(logfile_fnames)
+    cache = _as_cache(cache)
+    read_dbs_batch = partial(read_dbs, drop_cols=drop_cols, cache=cache)
+    logfile_args = [
+        (fname, methods, ignore_lines.get(fname, []), cache) for fname in logfile_fnames
+    ]
+    if processes == 1:
+        dbs = [read_dbs_batch(fname) for fname in dbs_fnames]
+        tables = [_read_logfile_batch(*args) for args in logfile_args]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            dbs = executor.map(read_dbs_batch, dbs_fnames)
+            tables = executor.map(_read_logfile_batch, *zip(*logfile_args))
+            dbs = list(dbs)
+            tables = list(tables)
+    dbs = pd.concat(dbs, ignore_index=True)
+    tables = LogfileTables.concat(tables)
+    tables.frame.reset_index(drop=True, inplace=True)
+    if ragged:
+        return dbs, tables
+    else:
+        return dbs, tables.to_logfile()
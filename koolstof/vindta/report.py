@@ -0,0 +1,237 @@
+"""Render all the QC figures and tables for a VINDTA dataset into a report."""
+
+import base64, json, os, re
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib import pyplot as plt
+from . import get, plot
+from .pipeline import _hash
+from ..meta import __version__
+
+
+def _fname_safe(name):
+    """Convert a session name into something safe to use in a filename."""
+    return re.sub(r"[^\w\-.]", "_", str(name))
+
+
+def _draw_figure(kind, fname, args, kwargs, agg):
+    """[process pool] Draw one report figure and save it to fname."""
+    if agg:
+        plt.switch_backend("Agg")
+    if kind == "increments":
+        fig, ax = plot.plot_increments(*args, **kwargs)
+    elif kind == "blanks":
+        fig, ax = plot.plot_session_blanks(*args, show_fig=False, **kwargs)
+    elif kind == "k_dic":
+        fig, ax = plot.plot_k_dic(*args, **kwargs)
+    elif kind == "dic_offset":
+        fig, ax = plot.plot_dic_offset(*args, **kwargs)
+    fig.savefig(fname)
+    plt.close(fig)
+
+
+def _get_figures(dbs, sessions, logfile, use_from, use_to, figure_format):
+    """List all the report figures with their drawing arguments and input hashes."""
+    session_col = sessions.index.name
+    figures = []
+    # Count increments for the whole dataset
+    tables = get._as_tables(logfile)
+    ix = tables.locate(dbs.logfile_index)
+    figures.append(
+        (
+            "increments",
+            "increments.{}".format(figure_format),
+            (dbs[["logfile_index", "run_time"]], tables),
+            {"use_from": use_from, "use_to": use_to},
+            _hash(
+                dbs.logfile_index,
+                dbs.run_time,
+                tables.offsets[ix[ix >= 0]],
+                tables.increments,
+                use_from,
+                use_to,
+            ),
+        )
+    )
+    # Blank fits, session by session
+    blank_cols = [
+        session_col,
+        "datenum_analysis_scaled",
+        "datetime_analysis",
+        "blank_here",
+        "blank_here_std",
+        "blank_good",
+    ]
+    session_blank_cols = [
+        "blank_progression",
+        "datenum_analysis_mean",
+        "datenum_analysis_std",
+    ]
+    dbs_blanks = dbs[blank_cols]
+    for session, dbs_session in dbs_blanks.groupby(session_col):
+        if session in sessions.index and sessions.blank_mean.notnull()[session]:
+            sessions_session = sessions.loc[[session], session_blank_cols]
+            figures.append(
+                (
+                    "blanks",
+                    "blanks_{}.{}".format(_fname_safe(session), figure_format),
+                    (dbs_session, sessions_session, session),
+                    {},
+                    _hash(dbs_session, sessions_session),
+                )
+            )
+    # Calibration factors and CRM offsets, if the DIC has been calibrated
+    if "dic_offset" in dbs and "k_dic_mean" in sessions:
+        k_dic_cols = [
+            session_col,
+            "datetime_analysis",
+            "k_dic_here",
+            "k_dic_good",
+            "dic_certified",
+        ]
+        figures.append(
+            (
+                "k_dic",
+                "k_dic.{}".format(figure_format),
+                (dbs[k_dic_cols], sessions[["k_dic_mean"]]),
+                {},
+                _hash(dbs[k_dic_cols], sessions.k_dic_mean),
+            )
+        )
+        offset_cols = [session_col, "datetime_analysis", "dic_offset", "k_dic_good"]
+        figures.append(
+            (
+                "dic_offset",
+                "dic_offset.{}".format(figure_format),
+                (dbs[offset_cols], sessions[[]]),
+                {},
+                _hash(dbs[offset_cols], sessions.index),
+            )
+        )
+    return figures
+
+
+def _write_html(report_dir, figures, sessions, single_file):
+    """Write the report's HTML page, linking to or embedding the figures."""
+    parts = [
+        "<!DOCTYPE html>",
+        "<html><head><meta charset='utf-8'><title>VINDTA QC report</title></head>",
+        "<body>",
+        "<h1>VINDTA QC report</h1>",
+        "<p>Generated with koolstof v{}.</p>".format(__version__),
+        "<h2>Sessions</h2>",
+        sessions.drop(columns="blank_progression", errors="ignore").to_html(),
+    ]
+    titles = {
+        "increments": "Coulometer increments",
+        "blanks": "Session blanks",
+        "k_dic": "Calibration factors",
+        "dic_offset": "CRM offsets",
+    }
+    last_kind = None
+    for kind, fname, _, _, _ in figures:
+        if kind != last_kind:
+            parts.append("<h2>{}</h2>".format(titles[kind]))
+            last_kind = kind
+        if single_file:
+            extension = os.path.splitext(fname)[1][1:]
+            mime = "image/svg+xml" if extension == "svg" else "image/" + extension
+            with open(os.path.join(report_dir, fname), "rb") as f:
+                src = "data:{};base64,{}".format(
+                    mime, base64.b64encode(f.read()).decode()
+                )
+        else:
+            src = fname
+        parts.append("<p><img src='{}' style='max-width:100%'></p>".format(src))
+    parts.append("</body></html>")
+    with open(os.path.join(report_dir, "report.html"), "w", encoding="utf-8") as f:
+        f.write("\n".join(parts))
+
+
+def qc_report(
+    dbs,
+    sessions,
+    logfile,
+    report_dir,
+    use_from=6,
+    use_to=100,
+    single_file=False,
+    processes=1,
+    figure_format="png",
+):
+    """Draw all the QC figures for a dataset and collect them into a report.
+
+    The report directory contains increments, session blank, calibration factor and
+    CRM offset figures (the latter two only if calibrate_dic has been run), the
+    sessions table as "sessions.csv" and a "report.html" page showing everything.  A
+    manifest of the inputs of each figure is kept in the directory, so when the
+    report is generated again, only the figures whose inputs have changed (e.g. the
+    sessions where some blank_good values were changed) are drawn again.
+
+    Parameters
+    ----------
+    dbs : pd.DataFrame
+        The dbs file as a pandas DataFrame (imported with read_dbs), having then
+        passed through blank_correction() and, optionally, calibrate_dic().
+    sessions : pd.DataFrame
+        The table of analysis sessions produced by blank_correction().
+    logfile : pd.DataFrame or LogfileTables
+        The logfile (imported with read_logfile).
+    report_dir : str
+        The directory to put the report in, which is created if it does not exist.
+    use_from, use_to : int, optional
+        The blank window to highlight in the increments figure, by default 6 and
+        100.
+    single_file : bool, optional
+        Whether to embed the figures in report.html so that it can be shared on its
+        own (True) or link to the figure files (False), by default False.
+    processes : int, optional
+        The maximum number of processes for drawing the figures, by default 1, in
+        which case they are drawn one by one.  If None, it is the number of CPUs.
+    figure_format : str, optional
+        Format extension in which to save the figures, by default "png".
+
+    Returns
+    -------
+    list
+        The filenames of the figures that were (re)drawn.
+    """
+    os.makedirs(report_dir, exist_ok=True)
+    manifest_fname = os.path.join(report_dir, "manifest.json")
+    if os.path.isfile(manifest_fname):
+        with open(manifest_fname, "r") as f:
+            manifest = json.load(f)
+    else:
+        manifest = {}
+    figures = _get_figures(dbs, sessions, logfile, use_from, use_to, figure_format)
+    # Delete figures of sessions that are no longer in the dataset
+    current = set(fname for _, fname, _, _, _ in figures)
+    for fname in set(manifest) - current:
+        if os.path.isfile(os.path.join(report_dir, fname)):
+            os.remove(os.path.join(report_dir, fname))
+        manifest.pop(fname)
+    # Draw only the figures whose inputs have changed
+    to_draw = [
+        figure
+        for figure in figures
+        if manifest.get(figure[1]) != figure[4]
+        or not os.path.isfile(os.path.join(report_dir, figure[1]))
+    ]
+    draw_args = [
+        (kind, os.path.join(report_dir, fname), args, kwargs)
+        for kind, fname, args, kwargs, _ in to_draw
+    ]
+    if processes == 1:
+        for args in draw_args:
+            _draw_figure(*args, False)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(_draw_figure, *args, True) for args in draw_args]
+            for future in futures:
+                future.result()
+    for _, fname, _, _, key in to_draw:
+        manifest[fname] = key
+    with open(manifest_fname, "w") as f:
+        json.dump(manifest, f, indent=2)
+    sessions.to_csv(os.path.join(report_dir, "sessions.csv"))
+    _write_html(report_dir, figures, sessions, single_file)
+    return [fname for _, fname, _, _, _ in to_draw]
@@ -21,6 +21,45 @@ def test_read_licor():
     return licor
 
 
+def test_read_licor_fast():
+    licor_slow = ksi.io.read_LI7000(filepath_licor)
+    licor_fast = ksi.io.read_LI7000(filepath_licor, fast=True)
+    assert (licor_fast.columns == licor_slow.columns).all()
+    assert licor_fast.x_CO2.dtype == np.float32
+    assert (licor_fast.datetime == licor_slow.datetime).all()
+    for col in ["x_CO2", "x_H2O", "temperature", "pressure", "flow_voltage"]:
+        assert np.allclose(licor_fast[col], licor_slow[col], rtol=1e-6)
+
+
+def test_get_licor_resolution():
+    """Are samples spread evenly within each second, coping with dropped and
+    duplicated samples, and do the timestamps always increase?
+    """
+    licor_irregular = pd.DataFrame(
+        {
+            "datetime": pd.to_datetime(
+                ["2020-07-03 08:51:00"]
+                + ["2020-07-03 08:51:01"] * 2
+                + ["2020-07-03 08:51:02"] * 3
+                + ["2020-07-03 08:51:03"]
+                + ["2020-07-03 08:51:04"] * 2
+                + ["2020-07-03 08:51:05"]
+            )
+        }
+    )
+    licor_irregular = ksi.io.get_licor_resolution(licor_irregular)
+    assert licor_irregular.datetime.dtype == "datetime64[ns]"
+    fractions = (
+        licor_irregular.datetime - licor_irregular.datetime.dt.floor("s")
+    ).dt.total_seconds()
+    assert np.allclose(fractions, [0.5, 0, 0.5, 0, 1 / 3, 2 / 3, 0, 0, 0.5, 0])
+    licor_file = ksi.io.read_LI7000(filepath_licor)
+    assert (np.diff(licor_file.datetime.values) > np.timedelta64(0)).all()
+    assert np.allclose(
+        licor_file.datenum, mdates.date2num(licor_file.datetime), rtol=0, atol=1e-9
+    )
+
+
 dbs = test_read_dbs()
 licor = test_read_licor()
 
@@ -41,9 +80,108 @@ def test_get_licor_samples():
     return licor_with_samples
 
 
+def test_get_licor_samples_segments():
+    licor_file = ksi.io.read_LI7000(filepath_licor)
+    licor_samples, segments = ksi.io.get_licor_samples(
+        licor_file, dbs, check_order=True, return_segments=True
+    )
+    assert (segments.end - segments.start).sum() == len(licor_samples)
+    for dbs_ix, segment in segments.iterrows():
+        assert (licor_samples.dbs_ix.iloc[segment.start : segment.end] == dbs_ix).all()
+    try:
+        ksi.io.get_licor_samples(licor_file, dbs.iloc[::-1], check_order=True)
+        assert False
+    except AssertionError as e:
+        assert "dbs is not in datenum order" in str(e)
+
+
 licor = test_get_licor_samples()
 
 
+def test_als_solvers():
+    """Do the banded and sparse ALS solvers find the same baseline?"""
+    x = np.linspace(0, 10, 2000)
+    y = 0.5 * x + 2 + 20 * np.exp(-((x - 4) ** 2) / 0.05)
+    baseline_banded = ksi.baseline.als(y, lam=1e9, p=1e-4)
+    baseline_sparse = ksi.baseline.als(y, lam=1e9, p=1e-4, solver="sparse")
+    assert np.allclose(baseline_banded, baseline_sparse, rtol=0, atol=1e-4)
+    assert np.abs(baseline_banded - (0.5 * x + 2)).max() < 0.01
+
+
+def test_als_convergence():
+    """Does ALS stop early once converged and warm-start from previous weights?"""
+    x = np.linspace(0, 10, 2000)
+    y = 0.5 * x + 2 + 20 * np.exp(-((x - 4) ** 2) / 0.05)
+    baseline, info = ksi.baseline.als(y, lam=1e9, p=1e-4, niter=50, full_output=True)
+    assert info["niter"] < 50
+    assert info["change"] == 0
+    assert np.array_equal(baseline, ksi.baseline.als(y, lam=1e9, p=1e-4, niter=50))
+    baseline_warm, info_warm = ksi.baseline.als(
+        y, lam=1e9, p=1e-4, w=info["w"], full_output=True
+    )
+    assert info_warm["niter"] == 1
+    assert np.allclose(baseline_warm, baseline)
+    # Warm start after adding new data to the end
+    y_more = np.append(y, y[-1] + 0.5 * (x[1] - x[0]) * np.arange(1, 101))
+    info_cold = ksi.baseline.als(y_more, lam=1e9, p=1e-4, tol=1e-3, full_output=True)[1]
+    info_more = ksi.baseline.als(
+        y_more, lam=1e9, p=1e-4, w=info["w"], tol=1e-3, full_output=True
+    )[1]
+    assert info_more["niter"] < info_cold["niter"]
+
+
+def test_als_windowed(tmp_path):
+    """Does the windowed ALS match the whole-record baseline, also when streaming
+    from disk and in parallel?
+    """
+    x_CO2 = ksi.io.read_LI7000(filepath_licor).x_CO2.values
+    baseline = ksi.baseline.als(x_CO2, lam=1e9, p=1e-4)
+    baseline_windowed = ksi.baseline.als_windowed(x_CO2, lam=1e9, p=1e-4)
+    assert np.abs(baseline_windowed - baseline).max() < 0.05
+    np.save(tmp_path / "x_CO2.npy", x_CO2)
+    out = np.lib.format.open_memmap(
+        tmp_path / "baseline.npy", mode="w+", shape=x_CO2.shape
+    )
+    ksi.baseline.als_windowed(
+        np.load(tmp_path / "x_CO2.npy", mmap_mode="r"),
+        lam=1e9,
+        p=1e-4,
+        processes=2,
+        out=out,
+    )
+    assert np.array_equal(out, baseline_windowed)
+    # A window that would only reach one point past the end should still be solved
+    baseline_windowed = ksi.baseline.als_windowed(
+        x_CO2, lam=1e9, p=1e-4, window=len(x_CO2) - 1, overlap=0
+    )
+    assert np.abs(baseline_windowed - baseline).max() < 0.05
+
+
+def test_als_batch():
+    """Does the batched ALS match als trace by trace, for both a 2-D array and
+    ragged traces with different parameters?
+    """
+    x_CO2 = ksi.io.read_LI7000(filepath_licor).x_CO2.values
+    traces = [x_CO2[i : i + 400 + i // 10] for i in range(0, 5000, 1000)]
+    lams = [1e6, 1e7, 1e8, 1e9, 1e9]
+    baselines, info = ksi.baseline.als_batch(traces, lams, 1e-4, full_output=True)
+    assert isinstance(baselines, list)
+    for trace, lam, baseline, niter in zip(traces, lams, baselines, info["niter"]):
+        baseline_single, info_single = ksi.baseline.als(
+            trace, lam, 1e-4, full_output=True
+        )
+        assert np.allclose(baseline, baseline_single)
+        assert niter == info_single["niter"]
+    sweep = ksi.baseline.als_batch(traces[0], lams, [1e-3, 1e-3, 1e-4, 1e-4, 1e-5])
+    assert sweep.shape == (5, len(traces[0]))
+    assert np.allclose(sweep[2], ksi.baseline.als(traces[0], 1e8, 1e-4))
+    block = np.array([traces[0][:400], traces[1][:400]])
+    assert np.allclose(
+        ksi.baseline.als_batch(block, 1e7, 1e-4)[1],
+        ksi.baseline.als(block[1], 1e7, 1e-4),
+    )
+
+
 licor["x_CO2_baseline"] = ksi.baseline.als(licor.x_CO2, lam=1e9, p=1e-4, niter=10)
 licor["x_CO2_corrected"] = licor.x_CO2 - licor.x_CO2_baseline
 licor["flow_CO2"] = (  # in mol/m**3
@@ -1,3 +1,4 @@
+import numpy as np, pandas as pd
 import koolstof as ks
 
 
@@ -5,4 +6,22 @@ def test_hello():
     ks.hello()
 
 
+def test_dbs_datetime():
+    """Are dbs dates and times converted with NaT where either is missing?"""
+    datetime = ks.misc.dbs_datetime(
+        pd.Series(["08/13/18", np.nan, "01/02/21"]), ["11:02", "11:03", np.nan]
+    )
+    assert datetime.dtype == "datetime64[ns]"
+    assert datetime[0] == pd.Timestamp("2018-08-13 11:02")
+    assert datetime[1:].isnull().all()
+    assert ks.misc.dbs_datetime([np.nan], [np.nan]).isnull().all()
+    # Times with seconds and four-digit years should also be parsed
+    datetime = ks.misc.dbs_datetime(["08/13/18", "08/13/2018"], ["11:02:33", "11:02"])
+    assert datetime[0] == pd.Timestamp("2018-08-13 11:02:33")
+    assert datetime[1] == pd.Timestamp("2018-08-13 11:02")
+    datetime = ks.misc.dbs_datetime(["08/13/18"], ["11:02:33"], time_format="%H:%M:%S")
+    assert datetime[0] == pd.Timestamp("2018-08-13 11:02:33")
+
+
 # test_hello()
+# test_dbs_datetime()
@@ -22,17 +22,182 @@ def test_read_dbs():
     assert "run_type" in dbs
 
 
+def test_read_logfile():
+    """Is the logfile imported with one titration table per row?"""
+    assert isinstance(logfile, pd.DataFrame)
+    assert logfile.index.name == "line_number"
+    assert logfile.bottle.notnull().all()
+    for row in logfile.itertuples():
+        assert len(row.table["minutes"]) == row.run_time + 1
+        assert row.table["counts"][-1] == row.counts
+    # The file should also be readable when it ends part way through a titration
+    with open(logfile_fname, "r") as f:
+        lines = f.read().splitlines()
+    parser = ksv.read._LogfileParser(methods=["3C standard", "3C standardRWS"])
+    for line in lines[: logfile.index[-1] + 10]:
+        parser.feed(line)
+    parser.close()
+    logfile_truncated = parser.to_frame()
+    assert len(logfile_truncated) == len(logfile)
+    assert logfile_truncated.run_time.iloc[-1] == 6
+
+
+def test_logfile_tables():
+    """Can the logfile be stored as flat arrays and used in the same way?"""
+    tables = ksv.read_logfile(
+        logfile_fname, methods=["3C standard", "3C standardRWS"], ragged=True
+    )
+    assert isinstance(tables, ksv.LogfileTables)
+    assert len(tables) == len(logfile)
+    assert tables.offsets[-1] == len(tables.minutes) == len(tables.segment_ids)
+    assert (tables.lengths == logfile.run_time + 1).all()
+    for k, v in logfile.table[logfile.index[5]].items():
+        assert np.all(tables.table(logfile.index[5])[k] == v)
+    assert (tables.locate([logfile.index[3], np.nan]) == [3, -1]).all()
+    logfile_again = tables.to_logfile()
+    pd.testing.assert_frame_equal(
+        logfile.drop(columns="table"), logfile_again.drop(columns="table")
+    )
+    assert list(logfile.columns) == list(logfile_again.columns)
+    tables_again = ksv.LogfileTables.from_logfile(logfile)
+    assert np.all(tables_again.increments == tables.increments)
+    # The get functions should give the same results with either format
+    dbs_df = ksv.read_dbs(dbs_fname)
+    dbs_ragged = ksv.read_dbs(dbs_fname)
+    ksv.get.get_sample_blanks(dbs_df, logfile)
+    ksv.get.get_sample_blanks(dbs_ragged, tables)
+    pd.testing.assert_frame_equal(dbs_df, dbs_ragged)
+    ksv.get_counts_at(dbs_df, logfile, counts_loc=8)
+    ksv.get_counts_at(dbs_ragged, tables, counts_loc=8)
+    pd.testing.assert_frame_equal(dbs_df, dbs_ragged)
+
+
+def test_logfile_follower(tmp_path):
+    """Does following a growing logfile give the same result as reading it in full?"""
+    methods = ["3C standard", "3C standardRWS"]
+    with open(logfile_fname, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    # Split the file part way through a titration table and part way through a line
+    split = logfile.index[100] + 8
+    live_fname = str(tmp_path / "logfile.bak")
+    with open(live_fname, "wb") as f:
+        f.write(b"".join(lines[:split]) + lines[split][:2])
+    follower = ksv.LogfileFollower(live_fname, methods=methods)
+    logfile_live = follower.update()
+    logfile_part = ksv.read_logfile(live_fname, methods=methods)
+    assert len(logfile_live) == 101
+    assert logfile_live.run_time.iloc[-1] == 4
+    pd.testing.assert_frame_equal(
+        logfile_live.drop(columns="table"), logfile_part.drop(columns="table")
+    )
+    with open(live_fname, "ab") as f:
+        f.write(lines[split][2:] + b"".join(lines[split + 1 :]))
+    logfile_live = follower.update()
+    pd.testing.assert_frame_equal(
+        logfile_live.drop(columns="table"), logfile.drop(columns="table")
+    )
+    for table_live, table in zip(logfile_live.table, logfile.table):
+        assert np.all(table_live["counts"] == table["counts"])
+    assert follower.offset == sum(len(line) for line in lines)
+    # Processing should work before the first titration has finished
+    empty_fname = str(tmp_path / "empty.bak")
+    open(empty_fname, "w").close()
+    dbs_live = ksv.read_dbs(dbs_fname)
+    ksv.blank_correction(dbs_live, ksv.LogfileFollower(empty_fname).update())
+    assert dbs_live.logfile_index.isnull().all()
+
+
+def test_read_batch():
+    """Are multiple files imported and concatenated, with and without parallel?"""
+    methods = ["3C standard", "3C standardRWS"]
+    dbs_batch, logfile_batch = ksv.read_batch(
+        [dbs_fname, dbs_fname], "tests/data/logfile_*.bak", methods=methods
+    )
+    assert len(dbs_batch) == 2 * len(dbs)
+    assert dbs_batch.index.is_unique
+    assert (dbs_batch.dbs_fname == dbs_fname).all()
+    assert logfile_batch.index.is_unique
+    assert (logfile_batch.line_number == logfile.index).all()
+    assert (logfile_batch.logfile_fname == logfile_fname).all()
+    dbs_serial, tables_serial = ksv.read_batch(
+        dbs_fname, logfile_fname, methods=methods, ragged=True, processes=1
+    )
+    pd.testing.assert_frame_equal(dbs_serial, dbs_batch.iloc[: len(dbs)])
+    assert isinstance(tables_serial, ksv.LogfileTables)
+    ksv.blank_correction(dbs_serial, tables_serial)
+    assert (dbs_serial.counts_corrected == dbs.counts_corrected).all()
+
+
+def test_parse_cache(tmp_path):
+    """Are cached logfiles and dbs files reloaded unchanged, and is the cache kept
+    below its size limit?
+    """
+    methods = ["3C standard", "3C standardRWS"]
+    cache = ksv.ParseCache(tmp_path / "cache")
+    for i in range(2):
+        logfile_cached = ksv.read_logfile(logfile_fname, methods=methods, cache=cache)
+        dbs_cached = ksv.read_dbs(dbs_fname, cache=cache)
+        assert len(cache._files()) == 2
+        assert logfile_cached.drop(columns="table").equals(
+            logfile.drop(columns="table")
+        )
+        assert np.array_equal(
+            logfile_cached.table.iloc[5]["counts"], logfile.table.iloc[5]["counts"]
+        )
+        assert dbs_cached.equals(ksv.read_dbs(dbs_fname))
+    tables = ksv.read_logfile(
+        logfile_fname, methods=methods, ragged=True, cache=str(tmp_path / "cache")
+    )
+    assert np.array_equal(
+        tables.offsets, ksv.LogfileTables.from_logfile(logfile).offsets
+    )
+    # Reading with different settings makes a new entry
+    ksv.read_logfile(logfile_fname, cache=cache)
+    assert len(cache._files()) == 3
+    cache.max_bytes = 0
+    cache._evict()
+    assert len(cache._files()) == 0
+
+
 def test_get_logfile_index():
     dbs = ksv.read_dbs(dbs_fname)
     assert "logfile_index" not in dbs
-    ksv.get.get_logfile_index(dbs, logfile)
+    diagnostics = ksv.get.get_logfile_index(dbs, logfile)
     assert "logfile_index" in dbs
+    assert isinstance(diagnostics, pd.DataFrame)
+    assert len(diagnostics) == 0
+    # Titrations that appear twice in the logfile should not be matched
+    matched = dbs.logfile_index.iloc[:3].values
+    logfile_doubled = pd.concat([logfile, logfile.loc[matched]]).reset_index()
+    diagnostics = ksv.get.get_logfile_index(dbs, logfile_doubled)
+    assert dbs.logfile_index.iloc[:3].isnull().all()
+    assert dbs.logfile_index.iloc[3:].notnull().all()
+    assert (diagnostics.index == dbs.index[:3]).all()
+    assert (diagnostics.n_matches == 2).all()
+    # A logfile with no titrations yet should match nothing
+    diagnostics = ksv.get.get_logfile_index(dbs, logfile.iloc[:0])
+    assert dbs.logfile_index.isnull().all()
+    assert len(diagnostics) == 0
 
 
 def test_get_sample_blanks():
     dbs = ksv.read_dbs(dbs_fname)
-    ksv.get.get_sample_blanks(dbs, logfile)
+    ksv.get.get_sample_blanks(dbs, logfile, use_from=8, use_to=12)
     assert "blank_here" in dbs
+    # Compare with calculating the statistics directly for one sample
+    table = logfile.table[dbs.logfile_index[10]]
+    blank = table["increments"][(table["minutes"] >= 8) & (table["minutes"] <= 12)]
+    assert np.isclose(dbs.blank_here[10], blank.mean())
+    assert np.isclose(dbs.blank_here_std[10], blank.std())
+    assert dbs.blank_here_min[10] == blank.min()
+    assert dbs.blank_here_max[10] == blank.max()
+    assert dbs.blank_here_count[10] == len(blank)
+    assert dbs.run_time[10] == table["minutes"].max()
+    # Samples with no increments in the blank window should get NaNs
+    ksv.get.get_sample_blanks(dbs, logfile, use_from=50)
+    assert dbs.blank_here.isnull().all()
+    assert dbs.counts.isnull().all()
+    assert (dbs.blank_here_count == 0).all()
 
 
 def test_get_session_blanks():
@@ -42,6 +207,75 @@ def test_get_session_blanks():
     assert "blank_here" in dbs
 
 
+def test_jac_blank_progression():
+    """Does the analytic Jacobian match a finite-difference estimate?"""
+    datenum_scaled = np.linspace(-2, 2, 50)
+    blank_here = np.full_like(datenum_scaled, 10.0)
+    # The second parameter set is clipped at zero for some of datenum_scaled
+    for x0 in [np.array([30.0, 1.0, 0.5, 1.0, 1.2]), np.array([1.0, 3.0, 0, 1, 1])]:
+        jac = ksv.get._jac_blank_progression(x0, datenum_scaled, blank_here)
+        jac_fd = np.full_like(jac, np.nan)
+        for i in range(5):
+            dx = np.zeros(5)
+            dx[i] = 1e-6
+            jac_fd[:, i] = (
+                ksv.get._lsqfun_blank_progression(x0 + dx, datenum_scaled, blank_here)
+                - ksv.get._lsqfun_blank_progression(x0 - dx, datenum_scaled, blank_here)
+            ) / 2e-6
+        assert np.allclose(jac, jac_fd, atol=1e-6)
+    assert (jac[datenum_scaled < -1 / 3] == 0).all()
+
+
+def test_blank_start():
+    """Do warm-started session blank fits find equally good solutions?"""
+    for blank_start in ["linear", "previous", [15, 0, 0, 0, 1]]:
+        dbs = ksv.read_dbs(dbs_fname)
+        sessions_start = ksv.get.get_session_blanks(
+            dbs, logfile, blank_start=blank_start
+        )
+        assert (sessions_start.index == sessions.index).all()
+        assert np.allclose(
+            sessions_start.blank_fit_rmse, sessions.blank_fit_rmse, rtol=1e-4
+        )
+
+
+def test_session_blanks_executor():
+    """Are the session blank fits the same when run in parallel?"""
+    sessions_serial = ksv.get.get_session_blanks(ksv.read_dbs(dbs_fname), logfile)
+    for executor in ["thread", "process"]:
+        dbs = ksv.read_dbs(dbs_fname)
+        sessions_parallel = ksv.get.get_session_blanks(
+            dbs, logfile, executor=executor, max_workers=2, chunksize=2
+        )
+        pd.testing.assert_frame_equal(sessions_parallel, sessions_serial)
+
+
+def test_get_counts_at():
+    """Are the counts at a given minute or table location extracted correctly?"""
+    dbs = ksv.read_dbs(dbs_fname)
+    ksv.get_counts_at(dbs, logfile, counts_loc=8)
+    table = logfile.table[dbs.logfile_index[10]]
+    assert dbs.counts_at[10] == table["counts"][table["minutes"] == 8][0]
+    assert (dbs.run_time_at == 8).all()
+    ksv.get_counts_at(dbs, logfile, counts_iloc=-2)
+    assert dbs.counts_at[10] == table["counts"][-2]
+    assert dbs.run_time_at[10] == table["minutes"][-2]
+    ksv.get_counts_at(dbs, logfile)
+    assert (dbs.counts_at == dbs.counts).all()
+
+
+def test_get_counts_matrix():
+    """Is a matrix of counts against minutes returned for all samples?"""
+    dbs = ksv.read_dbs(dbs_fname)
+    counts = ksv.get_counts_matrix(dbs, logfile, minutes=[2, 8, 500])
+    assert (counts.index == dbs.index).all()
+    assert list(counts.columns) == [2, 8, 500]
+    ksv.get_counts_at(dbs, logfile, counts_loc=8)
+    assert (counts[8] == dbs.counts_at).all()
+    assert counts[500].isnull().all()
+    assert ksv.get_counts_matrix(dbs, logfile).shape == (len(dbs), 13)
+
+
 def test_get_counts_corrected():
     dbs = ksv.read_dbs(dbs_fname)
     ksv.get.get_counts_corrected(dbs, logfile)
@@ -50,6 +284,20 @@ def test_get_counts_corrected():
     ksv.get.get_sample_blanks(dbs, logfile)
     ksv.get.get_counts_corrected(dbs)
     assert "counts_corrected" in dbs
+    # Compare with evaluating one session's blank fit directly
+    sessions = ksv.get.get_session_blanks(dbs)
+    s = sessions.iloc[1]
+    l = dbs.dic_cell_id == s.name
+    datenum_scaled = (
+        dbs[l].datenum_analysis - s.datenum_analysis_mean
+    ) / s.datenum_analysis_std
+    assert np.allclose(
+        dbs[l].blank, ksv.get._blank_progression(s.blank_progression, datenum_scaled)
+    )
+    # Samples from sessions missing from the sessions table should get NaN
+    ksv.get.get_counts_corrected(dbs, sessions=sessions.drop(index=s.name))
+    assert dbs[l].counts_corrected.isnull().all()
+    assert dbs[~l].counts_corrected.notnull().all()
 
 
 def test_blank_correction():
@@ -59,6 +307,28 @@ def test_blank_correction():
     assert "counts_corrected" in dbs
 
 
+def test_sweep_blank_windows():
+    """Does sweeping blank windows match running blank_correction for each window?"""
+    dbs = ksv.read_dbs(dbs_fname)
+    sweep_sessions, sweep_samples = ksv.sweep_blank_windows(
+        dbs, logfile, use_from=[6, 8], use_to=[12, 100]
+    )
+    assert "logfile_index" not in dbs
+    assert len(sweep_sessions) == 4 * len(sessions)
+    assert len(sweep_samples) == 4 * len(dbs)
+    dbs_window = ksv.read_dbs(dbs_fname)
+    sessions_window = ksv.blank_correction(dbs_window, logfile, use_from=8, use_to=12)
+    samples = sweep_samples[
+        (sweep_samples.use_from == 8) & (sweep_samples.use_to == 12)
+    ]
+    assert (samples.dbs_index == dbs_window.index).all()
+    assert np.allclose(samples.counts_corrected, dbs_window.counts_corrected)
+    sessions_sweep = sweep_sessions[
+        (sweep_sessions.use_from == 8) & (sweep_sessions.use_to == 12)
+    ].set_index("dic_cell_id")
+    assert np.allclose(sessions_sweep.blank_mean, sessions_window.blank_mean)
+
+
 def test_get_standard_calibrations():
     dbs = ksv.read_dbs(dbs_fname)
     ksv.blank_correction(dbs, logfile)
@@ -80,6 +350,114 @@ def test_calibrate_dic():
     assert ~dbs.dic.isnull().any()
 
 
+def test_online_calibrator(capsys):
+    """Does the OnlineCalibrator match calibrate_dic once all CRMs are in, and do its
+    rolling window and time-weighted modes give the right running means?
+    """
+    dbs_online = ksv.read_dbs(dbs_fname)
+    sessions_online = ksv.blank_correction(dbs_online, logfile)
+    dbs_online["dic_certified"] = dbs.dic_certified
+    calibrator = ksv.OnlineCalibrator()
+    capsys.readouterr()
+    for i in range(len(dbs_online)):
+        calibrator.add_standards(dbs_online.iloc[[i]])
+        calibrator.calibrate(dbs_online.iloc[[i]])
+    # The default temperature and salinity should not be reported for every row
+    assert capsys.readouterr().out == ""
+    ksv.calibrate_dic(dbs_online, sessions_online)
+    online = calibrator.sessions
+    for k in ["k_dic_mean", "k_dic_std", "k_dic_count"]:
+        assert np.allclose(online[k], sessions_online.loc[online.index, k])
+    assert np.allclose(calibrator.calibrate(dbs_online), dbs_online.dic)
+    values = np.array([1.0, 2.0, 4.0, 8.0])
+    datenums = np.array([0.0, 1.0, 1.5, 3.5])
+    rolling = ksv.OnlineCalibrator(window=2)
+    weighted = ksv.OnlineCalibrator(halflife=1.0)
+    for i in range(len(values)):
+        rolling.add("s", values[i])
+        weighted.add("s", values[i], datenums[i])
+        assert np.isclose(rolling.k_dic("s"), values[max(0, i - 1) : i + 1].mean())
+        weights = 0.5 ** (datenums[i] - datenums[: i + 1])
+        assert np.isclose(
+            weighted.k_dic("s"), np.sum(weights * values[: i + 1]) / np.sum(weights)
+        )
+    assert np.isclose(rolling.sessions.k_dic_std.iloc[0], np.std([4, 8], ddof=1))
+    assert np.isnan(rolling.k_dic("not a session"))
+
+
+def test_dic_pipeline():
+    """Does DicPipeline match the step-by-step processing and only rerun the stages
+    affected by a parameter change?
+    """
+    dic_certified = np.where(dbs.bottle.str.startswith("CRM"), 2029.19, np.nan)
+    pipeline = ksv.DicPipeline(
+        dbs_fname,
+        logfile_fname,
+        methods=["3C standard", "3C standardRWS"],
+        dic_certified=dic_certified,
+    )
+    dbs_pipeline, sessions_pipeline = pipeline.run()
+    assert pipeline.computed == list(pipeline.stages)
+    dbs_steps = ksv.read_dbs(dbs_fname)
+    dbs_steps["dic_certified"] = dic_certified
+    sessions_steps = ksv.blank_correction(dbs_steps, logfile)
+    ksv.calibrate_dic(dbs_steps, sessions_steps)
+    assert np.allclose(dbs_pipeline.dic, dbs_steps.dic, equal_nan=True)
+    assert np.allclose(sessions_pipeline.k_dic_mean, sessions_steps.k_dic_mean)
+    pipeline.run()
+    assert pipeline.computed == []
+    pipeline.set(dic_certified=dic_certified + 1)
+    pipeline.run()
+    assert pipeline.computed == ["calibration"]
+    pipeline.set(use_from=8)
+    pipeline.run()
+    assert pipeline.computed == [
+        "sample_blanks",
+        "session_blanks",
+        "counts_corrected",
+        "calibration",
+    ]
+    pipeline.set(use_from=6, dic_certified=dic_certified)
+    pipeline.run()
+    assert pipeline.computed == []
+    assert pipeline.dbs.dic.equals(dbs_pipeline.dic)
+    # Columns left over from an earlier calibration of the input should be updated
+    pipeline = ksv.DicPipeline(dbs.copy(), logfile, use_from=9)
+    dbs_pipeline, sessions_pipeline = pipeline.run()
+    dbs_steps = ksv.read_dbs(dbs_fname)
+    dbs_steps["dic_certified"] = dic_certified
+    sessions_steps = ksv.blank_correction(dbs_steps, logfile, use_from=9)
+    ksv.calibrate_dic(dbs_steps, sessions_steps)
+    assert np.allclose(dbs_pipeline.dic, dbs_steps.dic, equal_nan=True)
+    assert np.allclose(sessions_pipeline.k_dic_mean, sessions_steps.k_dic_mean)
+
+
+def test_dbs2data():
+    """Are duplicate analyses averaged into the data table and bottle IDs matched?"""
+    dbs_p = pd.DataFrame(
+        {
+            "bottle": ["a", "a", "a", "b", "c", "c", "c", "e"],
+            "dic": [2000.0, np.nan, 2004.0, 2010.0, 1990.0, 1995.0, 2100.0, 2050.0],
+            "dic_good": [True, True, True, True, True, True, False, True],
+        }
+    )
+    data = pd.DataFrame({"station_bottleid": ["a", "b", "c", "d"]}, index=[5, 6, 7, 8])
+    ksv.process.dbs2data(dbs_p, data, "dic")
+    # NaN replicates are skipped in the mean and std but still counted
+    assert np.allclose(data.dic, [2002, 2010, 1992.5, np.nan], equal_nan=True)
+    assert np.allclose(data.dic_std, [2, np.nan, 2.5, np.nan], equal_nan=True)
+    assert (data.dic_count == [3, 1, 2, 0]).all()
+    data_index = ksv.process.get_data_index(dbs_p, data)
+    assert np.allclose(data_index, [5, 5, 5, 6, 7, 7, 7, np.nan], equal_nan=True)
+    assert ksv.process.get_data_index(dbs_p.iloc[3], data) == 6
+    data.loc[8, "station_bottleid"] = "a"
+    try:
+        ksv.process.get_data_index(dbs_p, data)
+        assert False
+    except AssertionError as e:
+        assert "more than one bottle ID match for a" in str(e)
+
+
 def test_plots():
     ksv.plot_increments(dbs, logfile)
     ksv.plot_session_blanks(dbs, sessions, sessions.index[0])
@@ -96,12 +474,64 @@ def test_plots():
     ksv.plot_dic_offset(dbs, sessions)
 
 
+def test_plot_blanks_parallel(tmp_path):
+    """Are session blank figures saved when drawn in a process pool?"""
+    ksv.plot_blanks(dbs, sessions, processes=2, figure_path=str(tmp_path))
+    assert sorted(f.name for f in tmp_path.iterdir()) == sorted(
+        "{}.png".format(session)
+        for session in sessions[sessions.blank_mean.notnull()].index
+    )
+
+
+def test_qc_report(tmp_path):
+    """Is the QC report written, and are only figures with changed inputs redrawn?"""
+    dbs_report = ksv.read_dbs(dbs_fname)
+    sessions_report = ksv.blank_correction(dbs_report, logfile)
+    dbs_report["dic_certified"] = dbs.dic_certified
+    ksv.calibrate_dic(dbs_report, sessions_report)
+    drawn = ksv.qc_report(dbs_report, sessions_report, logfile, str(tmp_path))
+    assert len(drawn) == 3 + sessions_report.blank_mean.notnull().sum()
+    for fname in drawn + ["report.html", "sessions.csv", "manifest.json"]:
+        assert (tmp_path / fname).is_file()
+    assert ksv.qc_report(dbs_report, sessions_report, logfile, str(tmp_path)) == []
+    session = sessions_report.index[1]
+    dbs_report.loc[
+        dbs_report.index[dbs_report.dic_cell_id == session][3], "blank_good"
+    ] = False
+    sessions_report = ksv.blank_correction(dbs_report, logfile)
+    ksv.calibrate_dic(dbs_report, sessions_report)
+    drawn = ksv.qc_report(
+        dbs_report, sessions_report, logfile, str(tmp_path), single_file=True
+    )
+    assert "blanks_{}.png".format(session) in drawn
+    assert "blanks_{}.png".format(sessions_report.index[0]) not in drawn
+    assert "increments.png" not in drawn
+    with open(tmp_path / "report.html") as f:
+        assert "data:image/png;base64," in f.read()
+
+
 # test_read_dbs()
+# test_read_logfile()
+# test_logfile_tables()
+# test_logfile_follower()
+# test_read_batch()
+# test_parse_cache()
 # test_get_logfile_index()
 # test_get_sample_blanks()
 # test_get_session_blanks()
+# test_jac_blank_progression()
+# test_blank_start()
+# test_session_blanks_executor()
+# test_get_counts_at()
+# test_get_counts_matrix()
 # test_get_counts_corrected()
 # test_blank_correction()
+# test_sweep_blank_windows()
 # test_get_standard_calibrations()
 # test_calibrate_dic()
+# test_online_calibrator()
+# test_dic_pipeline()
+# test_dbs2data()
 # test_plots()
+# test_plot_blanks_parallel()
+# test_qc_report()